@@ -0,0 +1,121 @@
+import os
+import time
+import json
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# Bounded LRU + TTL cache for AI answers, with an optional SQLite tier
+# that survives restarts. Keys hash every input that shapes the answer,
+# so changing a guild setting simply produces a different key.
+
+CACHE_SIZE = int(os.getenv("AI_CACHE_SIZE", "1024"))
+CACHE_TTL = float(os.getenv("AI_CACHE_TTL", "3600"))
+CACHE_PATH = os.getenv("AI_CACHE_PATH", "")
+CACHE_DISK_SIZE = int(os.getenv("AI_CACHE_DISK_SIZE", "20000"))
+
+
+def normalize_prompt(prompt):
+    return " ".join(str(prompt).split()).casefold()
+
+
+def make_key(model, persona, temperature, max_tokens, prompt):
+    raw = json.dumps(
+        [model, persona, float(temperature), int(max_tokens), normalize_prompt(prompt)],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _DiskTier:
+    def __init__(self, path, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS ai_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)")
+        self._db.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT value, created FROM ai_cache WHERE key = ?", (key,)).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        return row[0], row[1]
+
+    def set(self, key, value, created):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO ai_cache (key, value, created) VALUES (?, ?, ?)", (key, value, created))
+            self._writes += 1
+            # Trim expired and oldest rows every so often rather than on every write
+            if self._writes % 100 == 0:
+                self._db.execute("DELETE FROM ai_cache WHERE created < ?", (time.time() - self.ttl,))
+                self._db.execute(
+                    "DELETE FROM ai_cache WHERE key IN (SELECT key FROM ai_cache ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class ResponseCache:
+    def __init__(self, max_entries=CACHE_SIZE, ttl=CACHE_TTL, path=CACHE_PATH, disk_entries=CACHE_DISK_SIZE):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (value, created)
+        self._disk = _DiskTier(path, disk_entries, ttl) if path else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _remember(self, key, value, created):
+        self._entries[key] = (value, created)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            if time.time() - entry[1] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            del self._entries[key]
+        if self._disk is not None:
+            entry = await asyncio.to_thread(self._disk.get, key)
+            if entry is not None:
+                self._remember(key, entry[0], entry[1])
+                self.disk_hits += 1
+                return entry[0]
+        self.misses += 1
+        return None
+
+    async def set(self, key, value):
+        created = time.time()
+        self._remember(key, value, created)
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk.set, key, value, created)
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def close(self):
+        if self._disk is not None:
+            self._disk.close()
+            self._disk = None
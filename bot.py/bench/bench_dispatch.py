@@ -0,0 +1,82 @@
+# Micro-benchmark of prefix command dispatch cost per message.
+# Compares the table-driven router with the old startswith chain.
+#
+#   python bench/bench_dispatch.py [--messages 100000] [--guilds 1000]
+
+import os
+import sys
+import random
+import argparse
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from router import CommandRouter  # noqa: E402
+
+COMMANDS = ["setwelcomechannel", "getwelcomechannel", "hello", "mf", "help", "imagine", "ask", "set", "settings"]
+
+
+def legacy_dispatch(content, prefix="&"):
+    # The old on_message: every branch checks every prefixed message
+    matched = []
+    if content.startswith(prefix):
+        command = content[len(prefix):]
+        for name in COMMANDS:
+            if command.startswith(name):
+                matched.append(name)
+    return matched
+
+
+def build_router(guilds):
+    router = CommandRouter("&")
+    # Every other guild has a custom prefix
+    for guild_id in range(0, guilds, 2):
+        router.set_prefix(guild_id, "!")
+    for name in COMMANDS:
+        router.command(name)(lambda message, args: None)
+    return router
+
+
+def build_messages(count, guilds, command_ratio):
+    rng = random.Random(42)
+    chatter = ["lol", "anyone up?", "gg", "&", "what's the plan tonight", "brb"]
+    messages = []
+    for _ in range(count):
+        guild_id = rng.randrange(guilds)
+        if rng.random() < command_ratio:
+            content = ("!" if guild_id % 2 == 0 else "&") + rng.choice(COMMANDS) + " what is the fastest land animal"
+        else:
+            content = rng.choice(chatter)
+        messages.append((content, guild_id))
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--guilds", type=int, default=1000)
+    parser.add_argument("--command-ratio", type=float, default=0.1)
+    parser.add_argument("--repeat", type=int, default=5)
+    opts = parser.parse_args()
+
+    router = build_router(opts.guilds)
+    messages = build_messages(opts.messages, opts.guilds, opts.command_ratio)
+
+    def run_router():
+        resolve = router.resolve
+        for content, guild_id in messages:
+            resolve(content, guild_id)
+
+    def run_legacy():
+        for content, _ in messages:
+            legacy_dispatch(content)
+
+    ambiguous = sum(1 for content, _ in messages if len(legacy_dispatch(content)) > 1)
+    for label, fn in (("router", run_router), ("legacy", run_legacy)):
+        best = min(timeit.repeat(fn, number=1, repeat=opts.repeat))
+        print(f"{label:>7}: {best / len(messages) * 1e9:8.1f} ns/message  ({len(messages) / best:,.0f} msg/s)")
+    print(f"legacy messages matching more than one command: {ambiguous}")
+
+
+if __name__ == "__main__":
+    main()
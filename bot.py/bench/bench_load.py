@@ -0,0 +1,352 @@
+# Offline load test: drives the real handlers in bot.py with synthetic
+# messages, interactions and member joins at a fixed arrival rate, against
+# stub Gemini/Stability servers (stub_upstream.py) and a fake gateway
+# (fake_gateway.py). Reports throughput, latency percentiles per event
+# kind, event loop lag and memory, and can compare against a saved run.
+#
+#   python bench/bench_load.py [--rate 20] [--duration 30] [--json run.json] [--baseline base.json]
+#
+# Latency is measured from each event's scheduled arrival, so a backed-up
+# event loop shows up in the numbers instead of slowing the arrivals.
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+KINDS = ("message", "ask", "slash_ask", "slash_imagine", "join")
+DEFAULT_MIX = "message=60,ask=10,slash_ask=15,slash_imagine=5,join=10"
+
+CHATTER = ["lol", "anyone up?", "gg", "what's the plan tonight", "brb", "&", "nice one"]
+TOPICS = ["black holes", "sourdough", "rust lifetimes", "the roman empire", "jazz chords", "tide pools", "chess openings"]
+
+
+def parse_mix(text):
+    weights = {}
+    for part in text.split(","):
+        kind, _, weight = part.partition("=")
+        kind = kind.strip()
+        if kind not in KINDS:
+            raise SystemExit(f"Unknown event kind in --mix: {kind!r} (expected one of {', '.join(KINDS)})")
+        weights[kind] = float(weight or 1)
+    return weights
+
+
+def percentile(sorted_values, pct):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def latency_summary(values):
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p99": percentile(values, 99),
+        "max": values[-1] if values else 0.0,
+    }
+
+
+def start_stubs(opts):
+    cmd = [
+        sys.executable, os.path.join(HERE, "stub_upstream.py"),
+        "--gemini-latency", str(opts.gemini_latency),
+        "--stability-latency", str(opts.stability_latency),
+        "--error-rate", str(opts.error_rate),
+        "--image-error-rate", str(opts.image_error_rate),
+        "--throttle-rate", str(opts.throttle_rate),
+        "--image-size", str(opts.image_size),
+        "--seed", str(opts.seed),
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    line = proc.stdout.readline().strip()
+    if not line.startswith("listening on "):
+        proc.kill()
+        raise SystemExit(f"Stub servers failed to start: {line!r}")
+    return proc, line[len("listening on "):]
+
+
+def configure_env(opts, base_url, workdir):
+    # Must run before bot.py is imported; most of its config is read at import time
+    os.environ.update({
+        "TOKEN": "bench",
+        "GEMINI_API_KEY": "bench",
+        "STABILITY_API_KEY": "bench",
+        "GEMINI_BASE_URL": base_url,
+        "STABILITY_BASE_URL": base_url,
+        "BOT_DB_PATH": os.path.join(workdir, "bench.db"),
+        "IMAGE_CACHE_DIR": os.path.join(workdir, "image_cache") if opts.image_cache else "",
+        "AI_STREAMING": "1" if opts.stream else "0",
+        "METRICS_PORT": str(opts.metrics_port),
+    })
+    # Per-user limits would turn most synthetic traffic away; raise them
+    # unless the caller set them explicitly
+    for pool in ("TEXT", "IMAGE"):
+        for scope in ("GLOBAL", "GUILD", "USER"):
+            os.environ.setdefault(f"{pool}_{scope}_PER_MIN", "1000000")
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {kind: [] for kind in KINDS}
+        self.errors = {kind: 0 for kind in KINDS}
+        self.error_samples = []
+        self.loop_lag = []
+        self.rss_peak = 0
+
+    async def sample_loop(self, memreport, interval=0.05):
+        # Oversleep of a short sleep is the event loop lag; RSS is sampled alongside
+        next_rss = 0.0
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            now = time.perf_counter()
+            self.loop_lag.append(max(0.0, now - start - interval))
+            if now >= next_rss:
+                self.rss_peak = max(self.rss_peak, memreport.rss_bytes() or 0)
+                next_rss = now + 0.5
+
+
+async def fetch_stub_stats(base_url):
+    import aiohttp  # type: ignore[reportMissingImports]
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"{base_url}/stats") as resp:
+                return await resp.json()
+    except Exception:
+        return {}
+
+
+async def run(opts, bot, base_url):
+    from fake_gateway import FakeGateway
+    import memreport
+
+    rng = random.Random(opts.seed)
+    gateway = FakeGateway(guilds=opts.guilds, users=opts.users, rest_latency=opts.discord_latency)
+    gateway.attach(bot.client)
+    await bot.client.setup_hook()
+    if opts.ai_memory:
+        for guild in gateway.guilds:
+            bot.bot_settings.setdefault(guild.id, {})["ai_memory"] = True
+    # Half the guilds have a welcome channel, like a typical mix of servers
+    for i, guild in enumerate(gateway.guilds):
+        if i % 2 == 0:
+            bot.store.set_welcome_channel(guild.id, gateway.general[guild.id].id)
+
+    prompts = [f"question {i}: tell me something about {TOPICS[i % len(TOPICS)]}" for i in range(opts.prompts)]
+    weights = parse_mix(opts.mix)
+    kinds = list(weights)
+    kind_weights = [weights[k] for k in kinds]
+
+    async def slash(command, interaction, **kwargs):
+        # The same steps discord.py's tree runs around a slash command callback
+        await bot.on_interaction(interaction)
+        await bot.tree.interaction_check(interaction)
+        try:
+            await command.callback(interaction, **kwargs)
+        except Exception:
+            bot.record_slash_command(interaction, command, failed=True)
+            raise
+        bot.record_slash_command(interaction, command)
+
+    def build_event(kind):
+        guild = rng.choice(gateway.guilds)
+        user = rng.choice(gateway.users)
+        if kind == "message":
+            return bot.on_message(gateway.message(guild, user, rng.choice(CHATTER)))
+        if kind == "ask":
+            return bot.on_message(gateway.message(guild, user, f"{bot.prefix}ask {rng.choice(prompts)}"))
+        if kind == "slash_ask":
+            return slash(bot.slash_ask, gateway.interaction(guild, user), question=rng.choice(prompts))
+        if kind == "slash_imagine":
+            return slash(bot.slash_imagine, gateway.interaction(guild, user), prompt=rng.choice(prompts), count=opts.image_count)
+        return bot.on_member_join(gateway.member(guild))
+
+    recorder = Recorder()
+
+    async def timed(kind, coro, scheduled):
+        try:
+            await coro
+        except Exception as e:
+            recorder.errors[kind] += 1
+            if len(recorder.error_samples) < 5:
+                recorder.error_samples.append(f"{kind}: {type(e).__name__}: {e}")
+        recorder.latencies[kind].append(time.perf_counter() - scheduled)
+
+    rss_start = memreport.rss_bytes() or 0
+    sampler = asyncio.ensure_future(recorder.sample_loop(memreport))
+    tasks = set()
+    offered = 0
+    started = time.perf_counter()
+    deadline = started + opts.duration
+    scheduled = started
+    # Open-loop arrivals: exponential gaps at the requested mean rate
+    while True:
+        scheduled += rng.expovariate(opts.rate)
+        if scheduled >= deadline:
+            break
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        kind = rng.choices(kinds, kind_weights)[0]
+        task = asyncio.ensure_future(timed(kind, build_event(kind), scheduled))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        offered += 1
+
+    arrivals_done = time.perf_counter()
+    pending = len(tasks)
+    if tasks:
+        _, still_running = await asyncio.wait(set(tasks), timeout=opts.drain_timeout)
+        for task in still_running:
+            task.cancel()
+        pending = len(still_running)
+    elapsed = time.perf_counter() - started
+    sampler.cancel()
+    rss_end = memreport.rss_bytes() or 0
+
+    stub_stats = await fetch_stub_stats(base_url)
+    upstream_errors = {f"{api}:{status}": count for (api, status), count in bot.metrics.upstream_errors.values.items()}
+
+    # Same teardown as PeaceClient.close, minus the gateway
+    await bot.metrics_server.close()
+    await bot.cooldowns.close()
+    await bot.welcomes.close()
+    await bot.http_client.close()
+    await bot.store.close()
+    bot.response_cache.close()
+    bot.image_pipeline.shutdown()
+
+    completed = sum(len(v) for v in recorder.latencies.values())
+    return {
+        "config": {k: v for k, v in vars(opts).items() if k not in ("json", "baseline")},
+        "offered": offered,
+        "completed": completed,
+        "timed_out": pending,
+        "elapsed": elapsed,
+        "arrival_seconds": arrivals_done - started,
+        "throughput": completed / elapsed if elapsed else 0.0,
+        "kinds": {k: dict(latency_summary(v), errors=recorder.errors[k]) for k, v in recorder.latencies.items() if v or recorder.errors[k]},
+        "loop_lag": latency_summary(recorder.loop_lag),
+        "rss": {"start": rss_start, "end": rss_end, "peak": max(recorder.rss_peak, rss_end)},
+        "upstream_requests": stub_stats,
+        "upstream_errors": upstream_errors,
+        "pools": {p.name: {"admitted": p.admitted, "rejected": p.rejected} for p in (bot.text_pool, bot.image_pool)},
+        "caches": {
+            "ai": {"hits": bot.response_cache.hits + bot.response_cache.disk_hits, "misses": bot.response_cache.misses},
+            "image": {"hits": bot.image_cache.hits, "misses": bot.image_cache.misses},
+        },
+        "coalesced": {"ai": bot.ai_flights.joined, "image": bot.image_flights.joined},
+        "welcomes": {"single": bot.welcomes.sent_single, "batches": bot.welcomes.sent_batches, "dropped": bot.welcomes.dropped},
+        "discord_calls": gateway.rest_calls,
+        "error_samples": recorder.error_samples,
+    }
+
+
+def _ms(seconds):
+    return f"{seconds * 1000:9.1f}"
+
+
+def _mib(n):
+    return f"{n / (1024 * 1024):.1f} MiB"
+
+
+def _delta(new, old):
+    if not old:
+        return ""
+    return f" ({(new - old) / old * 100:+.1f}%)"
+
+
+def print_report(result, baseline=None):
+    base_kinds = (baseline or {}).get("kinds", {})
+    print(f"offered {result['offered']} events in {result['arrival_seconds']:.1f}s, "
+          f"completed {result['completed']} in {result['elapsed']:.1f}s, {result['timed_out']} still running at the drain timeout")
+    print(f"throughput: {result['throughput']:.1f} events/s{_delta(result['throughput'], (baseline or {}).get('throughput'))}")
+    print()
+    print(f"{'kind':<14}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for kind, s in result["kinds"].items():
+        print(f"{kind:<14}{s['count']:>7}{s['errors']:>8} {_ms(s['p50'])} {_ms(s['p90'])} {_ms(s['p99'])} {_ms(s['max'])}")
+        old = base_kinds.get(kind)
+        if old:
+            print(f"{'  vs baseline':<29}{_delta(s['p50'], old['p50']):>11}{_delta(s['p90'], old['p90']):>10}"
+                  f"{_delta(s['p99'], old['p99']):>10}{_delta(s['max'], old['max']):>10}")
+    lag = result["loop_lag"]
+    print()
+    print(f"event loop lag: p50 {lag['p50'] * 1000:.2f} ms, p99 {lag['p99'] * 1000:.2f} ms, max {lag['max'] * 1000:.2f} ms"
+          f"{_delta(lag['p99'], (baseline or {}).get('loop_lag', {}).get('p99'))}")
+    rss = result["rss"]
+    print(f"rss: {_mib(rss['start'])} at start, {_mib(rss['end'])} at end, {_mib(rss['peak'])} peak"
+          f"{_delta(rss['peak'], (baseline or {}).get('rss', {}).get('peak'))}")
+    print(f"upstream requests: {result['upstream_requests']}, errors: {result['upstream_errors'] or 'none'}")
+    print(f"pools: {result['pools']}")
+    print(f"caches: {result['caches']}, coalesced: {result['coalesced']}")
+    print(f"welcomes: {result['welcomes']}")
+    print(f"discord calls: {result['discord_calls']}")
+    for sample in result["error_samples"]:
+        print(f"error: {sample}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for the bot's event handlers")
+    parser.add_argument("--rate", type=float, default=20, help="mean events per second")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of arrivals")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"event kind weights (default {DEFAULT_MIX})")
+    parser.add_argument("--guilds", type=int, default=20)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--prompts", type=int, default=200, help="distinct prompts; fewer means more cache hits")
+    parser.add_argument("--image-count", type=int, default=1, help="variants per slash_imagine")
+    parser.add_argument("--discord-latency", type=float, default=0.05, help="seconds per fake Discord REST call")
+    parser.add_argument("--gemini-latency", type=float, default=0.8)
+    parser.add_argument("--stability-latency", type=float, default=4.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--image-error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--image-size", type=int, default=1024)
+    parser.add_argument("--no-stream", dest="stream", action="store_false", help="send /ask answers in one message")
+    parser.add_argument("--no-image-cache", dest="image_cache", action="store_false")
+    parser.add_argument("--ai-memory", action="store_true", help="turn on per-channel conversation memory in every guild")
+    parser.add_argument("--metrics-port", type=int, default=0, help="serve /metrics while the test runs")
+    parser.add_argument("--drain-timeout", type=float, default=120, help="seconds to wait for in-flight events")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare against results saved with --json")
+    opts = parser.parse_args()
+    parse_mix(opts.mix)
+
+    baseline = None
+    if opts.baseline:
+        with open(opts.baseline) as f:
+            baseline = json.load(f)
+
+    stubs, base_url = start_stubs(opts)
+    try:
+        with tempfile.TemporaryDirectory(prefix="peace-bench-") as workdir:
+            configure_env(opts, base_url, workdir)
+            import bot
+            result = asyncio.run(run(opts, bot, base_url))
+    finally:
+        stubs.terminate()
+        stubs.wait()
+
+    print_report(result, baseline)
+    if opts.json:
+        with open(opts.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+# Stand-ins for the discord.py objects the handlers in bot.py touch, so
+# events can be fed to them without a gateway connection. Every send, edit
+# and defer sleeps for a configurable REST latency and is counted.
+
+import asyncio
+import itertools
+import discord  # type: ignore[reportMissingImports]
+
+_ids = itertools.count(10**17)
+
+
+class Permissions:
+    def __init__(self, administrator=False):
+        self.administrator = administrator
+
+
+class FakeUser:
+    def __init__(self, name, administrator=False):
+        self.id = next(_ids)
+        self.name = name
+        self.bot = False
+        self.avatar = None
+        self.mention = f"<@{self.id}>"
+        self.guild_permissions = Permissions(administrator)
+
+
+class FakeMember(FakeUser):
+    def __init__(self, name, guild):
+        super().__init__(name)
+        self.guild = guild
+
+
+class FakeGuild:
+    def __init__(self, name):
+        self.id = next(_ids)
+        self.name = name
+        self.filesize_limit = 25 * 1024 * 1024
+        self.members = []
+
+
+class FakeMessage:
+    def __init__(self, gateway, channel, content="", author=None):
+        self.id = next(_ids)
+        self.gateway = gateway
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+
+    async def edit(self, content=None, **kwargs):
+        await self.gateway.rest("edit")
+        self.content = content
+        return self
+
+
+class _Typing:
+    def __init__(self, gateway):
+        self.gateway = gateway
+
+    async def __aenter__(self):
+        await self.gateway.rest("typing")
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeChannel:
+    def __init__(self, gateway, guild, name):
+        self.id = next(_ids)
+        self.gateway = gateway
+        self.guild = guild
+        self.name = name
+        self.mention = f"<#{self.id}>"
+
+    async def send(self, content=None, **kwargs):
+        await self.gateway.rest("send")
+        return FakeMessage(self.gateway, self, content)
+
+    def typing(self):
+        return _Typing(self.gateway)
+
+
+class _Response:
+    def __init__(self, interaction):
+        self._interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def defer(self, **kwargs):
+        await self._interaction.gateway.rest("defer")
+        self._done = True
+
+    async def send_message(self, content=None, **kwargs):
+        await self._interaction.gateway.rest("send")
+        self._done = True
+
+
+class _Followup:
+    def __init__(self, interaction):
+        self._interaction = interaction
+
+    async def send(self, content=None, wait=False, **kwargs):
+        await self._interaction.gateway.rest("send")
+        return FakeMessage(self._interaction.gateway, self._interaction.channel, content)
+
+
+class FakeInteraction:
+    def __init__(self, gateway, channel, user):
+        self.id = next(_ids)
+        self.gateway = gateway
+        self.type = discord.InteractionType.application_command
+        self.channel = channel
+        self.channel_id = channel.id
+        self.guild = channel.guild
+        self.user = user
+        self.extras = {}
+        self.command = None
+        self.response = _Response(self)
+        self.followup = _Followup(self)
+
+    async def edit_original_response(self, content=None, **kwargs):
+        await self.gateway.rest("edit")
+        return FakeMessage(self.gateway, self.channel, content)
+
+
+class FakeGateway:
+    def __init__(self, guilds=10, users=200, rest_latency=0.05):
+        self.rest_latency = rest_latency
+        self.rest_calls = {}
+        self.guilds = [FakeGuild(f"guild-{i}") for i in range(guilds)]
+        self.channels = {}
+        self.general = {}
+        for guild in self.guilds:
+            channel = FakeChannel(self, guild, "general")
+            self.channels[channel.id] = channel
+            self.general[guild.id] = channel
+        self.users = [FakeUser(f"user-{i}") for i in range(users)]
+
+    async def rest(self, kind):
+        self.rest_calls[kind] = self.rest_calls.get(kind, 0) + 1
+        if self.rest_latency:
+            await asyncio.sleep(self.rest_latency)
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    async def change_presence(self, **kwargs):
+        await self.rest("presence")
+
+    def message(self, guild, user, content):
+        return FakeMessage(self, self.general[guild.id], content, author=user)
+
+    def interaction(self, guild, user):
+        return FakeInteraction(self, self.general[guild.id], user)
+
+    def member(self, guild):
+        return FakeMember(f"newcomer-{next(_ids)}", guild)
+
+    def attach(self, client):
+        # Route the client's cache lookups and presence updates to the fakes
+        client.get_channel = self.get_channel
+        client.change_presence = self.change_presence
@@ -0,0 +1,171 @@
+# Local stand-ins for the Gemini and Stability REST endpoints, with
+# configurable latency and error rates. Used by bench_load.py, which runs
+# this in a separate process so the stubs don't share the bot's event loop.
+#
+#   python bench/stub_upstream.py [--port 8089] [--gemini-latency 0.8] [--error-rate 0.02]
+
+import io
+import sys
+import json
+import base64
+import random
+import asyncio
+import argparse
+from aiohttp import web  # type: ignore[reportMissingImports]
+
+try:
+    from PIL import Image  # type: ignore[reportMissingImports]
+except ImportError:
+    Image = None
+
+# 1x1 PNG for when Pillow is missing
+_TINY_PNG = (
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=="
+)
+
+_WORDS = "peace bot says the quick brown fox jumps over a lazy dog while the moon watches quietly".split()
+
+
+def make_image_b64(size, seed=0):
+    if Image is None or size <= 1:
+        return _TINY_PNG
+    # Noise compresses like a real render instead of like a flat fill
+    rng = random.Random(seed)
+    img = Image.frombytes("RGB", (size, size), rng.randbytes(size * size * 3))
+    out = io.BytesIO()
+    img.save(out, format="PNG")
+    return base64.b64encode(out.getvalue()).decode("ascii")
+
+
+class Stub:
+    def __init__(self, opts):
+        self.opts = opts
+        self.rng = random.Random(opts.seed)
+        # Encoding a big PNG is slow, so a few are made up front and reused
+        self.images = [make_image_b64(opts.image_size, seed=i) for i in range(4)]
+        self.requests = {"gemini": 0, "gemini_stream": 0, "stability": 0}
+
+    async def _delay(self, mean):
+        # Latency is mean +/- jitter, never negative
+        jitter = self.opts.jitter * mean
+        await asyncio.sleep(max(0.0, mean + self.rng.uniform(-jitter, jitter)))
+
+    def _failure(self, error_rate):
+        roll = self.rng.random()
+        if roll < self.opts.throttle_rate:
+            return web.Response(status=429, text="rate limited", headers={"Retry-After": str(self.opts.retry_after)})
+        if roll < self.opts.throttle_rate + error_rate:
+            return web.Response(status=500, text="stub upstream error")
+        return None
+
+    def _answer(self, prompt):
+        words = [_WORDS[(len(prompt) + i) % len(_WORDS)] for i in range(max(1, self.opts.answer_chars // 6))]
+        return " ".join(words)[:self.opts.answer_chars]
+
+    @staticmethod
+    def _prompt(body):
+        try:
+            return body["contents"][-1]["parts"][0]["text"]
+        except (KeyError, IndexError, TypeError):
+            return ""
+
+    async def gemini(self, request):
+        method = request.match_info["method"]
+        body = await request.json()
+        if method == "streamGenerateContent":
+            return await self.gemini_stream(request, body)
+        self.requests["gemini"] += 1
+        await self._delay(self.opts.gemini_latency)
+        failure = self._failure(self.opts.error_rate)
+        if failure is not None:
+            return failure
+        text = self._answer(self._prompt(body))
+        return web.json_response({"candidates": [{"content": {"parts": [{"text": text}]}}]})
+
+    async def gemini_stream(self, request, body):
+        self.requests["gemini_stream"] += 1
+        # Time to first chunk is a third of the latency, the rest is spread over the chunks
+        first = self.opts.gemini_latency / 3
+        await self._delay(first)
+        failure = self._failure(self.opts.error_rate)
+        if failure is not None:
+            return failure
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await resp.prepare(request)
+        text = self._answer(self._prompt(body))
+        chunks = max(1, self.opts.stream_chunks)
+        step = (len(text) + chunks - 1) // chunks or 1
+        for i in range(0, len(text), step):
+            if i:
+                await asyncio.sleep((self.opts.gemini_latency - first) / chunks)
+            event = {"candidates": [{"content": {"parts": [{"text": text[i:i + step]}]}}]}
+            await resp.write(f"data: {json.dumps(event)}\r\n\r\n".encode("utf-8"))
+        await resp.write_eof()
+        return resp
+
+    async def stability(self, request):
+        self.requests["stability"] += 1
+        body = await request.json()
+        await self._delay(self.opts.stability_latency)
+        failure = self._failure(self.opts.image_error_rate)
+        if failure is not None:
+            return failure
+        samples = int(body.get("samples", 1))
+        artifacts = [{"base64": self.images[i % len(self.images)], "finishReason": "SUCCESS"} for i in range(samples)]
+        return web.json_response({"artifacts": artifacts})
+
+    async def stats(self, request):
+        return web.json_response(self.requests)
+
+
+def build_app(opts):
+    stub = Stub(opts)
+    app = web.Application(client_max_size=16 * 1024 * 1024)
+    app.router.add_post("/v1beta/models/{model}:{method}", stub.gemini)
+    app.router.add_post("/v1/generation/{engine}/text-to-image", stub.stability)
+    app.router.add_get("/stats", stub.stats)
+    return app
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Stub Gemini and Stability servers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="0 picks a free port")
+    parser.add_argument("--gemini-latency", type=float, default=0.8, help="seconds per answer")
+    parser.add_argument("--stability-latency", type=float, default=4.0, help="seconds per image request")
+    parser.add_argument("--jitter", type=float, default=0.25, help="latency jitter as a fraction of the mean")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of Gemini requests answered with 500")
+    parser.add_argument("--image-error-rate", type=float, default=0.0, help="share of Stability requests answered with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After sent with 429s")
+    parser.add_argument("--answer-chars", type=int, default=600)
+    parser.add_argument("--stream-chunks", type=int, default=8)
+    parser.add_argument("--image-size", type=int, default=1024)
+    parser.add_argument("--seed", type=int, default=42)
+    return parser
+
+
+async def serve(opts):
+    runner = web.AppRunner(build_app(opts), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, opts.host, opts.port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    # bench_load.py reads this line to find the port
+    print(f"listening on http://{opts.host}:{port}", flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+def main(argv=None):
+    opts = build_parser().parse_args(argv)
+    try:
+        asyncio.run(serve(opts))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
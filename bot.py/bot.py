@@ -1,17 +1,37 @@
 import discord  # type: ignore[reportMissingImports]
 from discord import app_commands  # type: ignore[reportMissingImports]
-import tracemalloc
 import os
 import asyncio
+import signal
 import time
 import google.generativeai as genai  # type: ignore[reportMissingImports]
-import requests
 import io
-import base64
+import json
+import hashlib
 from dotenv import load_dotenv  # type: ignore[reportMissingImports]
+# Load .env before the modules below read their settings from the environment
+load_dotenv()
 from help_embed import get_help_embed
+import http_client
+from streaming import StreamingReply
+from ai_cache import ResponseCache, make_key as make_cache_key
+from singleflight import SingleFlight
+from scheduler import PoolBusy, text_pool, image_pool
+from router import CommandRouter
+from storage import SettingsStore
+from command_sync import CommandSync
+from presence import PresenceManager
+import shards
+from conversation import ConversationStore
+from welcome import WelcomeDispatcher
+import memreport
+import metrics
+import image_pipeline
+from command_args import (
+    ArgumentError, DEFAULT_SETTINGS, MAX_IMAGE_COUNT, SETTING_OPTIONS,
+    check_image_count, parse_imagine_args, parse_prompt, parse_set_args, parse_setting,
+)
 
-load_dotenv()
 # Fix Windows asyncio shutdown noise ("Event loop is closed")
 if os.name == 'nt':
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
@@ -19,176 +39,509 @@ token = os.getenv("TOKEN")
 # Configure Gemini API key
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
-client = discord.Client(intents=discord.Intents.all())
-tree = app_commands.CommandTree(client)
+# discord.Client, or AutoShardedClient when SHARD_MODE is auto or worker
+class PeaceClient(shards.BaseClient):
+    _shutdown = None  # the one close() task every caller waits on
+
+    async def setup_hook(self):
+        # Open the shared HTTP session and load saved settings before any event is dispatched
+        await http_client.start()
+        await store.load()
+        for guild_id, settings in bot_settings.items():
+            router.set_prefix(guild_id, settings.get("prefix"))
+        store.start()
+        cooldowns.start()
+        await metrics_server.start()
+        # supervisor.py and most process managers stop the bot with SIGTERM;
+        # shut down as cleanly as on Ctrl+C so pending writes are flushed
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.ensure_future(self.close()))
+        except (NotImplementedError, AttributeError):
+            pass  # Windows has no loop signal handlers
+
+    async def __aexit__(self, *exc):
+        # discord.py skips close() here once the gateway is closed, which would
+        # let asyncio.run cancel a SIGTERM shutdown halfway through; wait for it
+        await self.close()
+
+    async def close(self):
+        # SIGTERM, Ctrl+C and the end of run() all wait on the same shutdown
+        if self._shutdown is None:
+            self._shutdown = asyncio.ensure_future(self._close_all())
+        await asyncio.shield(self._shutdown)
+
+    async def _close_all(self):
+        await super().close()
+        await metrics_server.close()
+        await cooldowns.close()
+        await welcomes.close()
+        await http_client.close()
+        await store.close()
+        response_cache.close()
+        image_pipeline.shutdown()
+
+# Allocation tracing is off unless asked for; see the `memory` command
+if os.getenv("TRACEMALLOC") == "1":
+    memreport.start_tracing()
+
+# Intents and member/message caches come from MEMORY_PROFILE, shards from SHARD_MODE
+client = PeaceClient(**memreport.client_options(), **shards.client_options())
+class PeaceTree(app_commands.CommandTree):
+    # Times every slash command; completion is recorded in on_app_command_completion
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        interaction.extras["started"] = time.perf_counter()
+        metrics.in_flight.inc("slash")
+        return True
+
+    async def on_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        record_slash_command(interaction, interaction.command, failed=True)
+        await super().on_error(interaction, error)
+
+tree = PeaceTree(client)
+
+def record_slash_command(interaction, command, failed=False):
+    started = interaction.extras.pop("started", None)
+    if started is None:
+        return
+    name = command.qualified_name if command else "unknown"
+    metrics.in_flight.dec("slash")
+    metrics.handler_seconds.observe(time.perf_counter() - started, "slash", name)
+    if failed:
+        metrics.handler_errors.inc("slash", name)
+
+# Settings and welcome channels are persisted by the store and read from memory
+store = SettingsStore()
+welcome_channels = store.welcome_channels  # guild id -> channel id
+bot_settings = store.settings  # Store bot settings per server
+
+# Each sharded worker cleans its own guilds; only the primary pushes global commands
+command_sync = CommandSync(tree, store, primary=shards.IS_PRIMARY)
+
+# Upstream 429 pauses shared with the other sharded workers through the store
+cooldowns = shards.SharedCooldowns(store, (text_pool, image_pool))
 
-welcome_channels = {}
-bot_settings = {}  # Store bot settings per server
+def get_welcome_channel(guild_id):
+    # Channels are stored as IDs and resolved lazily from the client cache
+    channel_id = welcome_channels.get(guild_id)
+    return client.get_channel(channel_id) if channel_id else None
+
+# One embed per new member, or batched welcomes while a guild is being flooded
+welcomes = WelcomeDispatcher(get_welcome_channel)
 
 prefix = "&"
 
-# Keep track of the last time a command was used
-last_command_time = None
+# Idle/active presence driven by slash and prefix command use
+presence = PresenceManager(client)
+
+# Counters kept by the other components, read when /metrics is scraped
+metrics_server = metrics.MetricsServer()
+metrics.Gauge("bot_pool_active", "Upstream calls holding an admission slot", ("pool",),
+              fn=lambda: {(p.name,): p.active for p in (text_pool, image_pool)})
+metrics.Gauge("bot_pool_queued", "Requests waiting for an admission slot", ("pool",),
+              fn=lambda: {(p.name,): p.queued for p in (text_pool, image_pool)})
+metrics.Counter("bot_pool_rejected_total", "Requests turned away as busy or rate limited", ("pool",),
+                fn=lambda: {(p.name,): p.rejected for p in (text_pool, image_pool)})
+metrics.Counter("bot_cache_events_total", "AI response and image cache lookups", ("cache", "result"),
+                fn=lambda: {
+                    ("ai", "hit"): response_cache.hits + response_cache.disk_hits,
+                    ("ai", "miss"): response_cache.misses,
+                    ("image", "hit"): image_cache.hits,
+                    ("image", "miss"): image_cache.misses,
+                })
+metrics.Counter("bot_singleflight_calls_total", "Upstream calls started vs joined by coalescing", ("kind", "result"),
+                fn=lambda: {
+                    ("ai", "started"): ai_flights.started, ("ai", "joined"): ai_flights.joined,
+                    ("image", "started"): image_flights.started, ("image", "joined"): image_flights.joined,
+                })
+metrics.Counter("bot_presence_updates_total", "Presence updates sent", fn=lambda: {(): presence.updates_sent})
+metrics.Counter("bot_presence_checks_total", "Presence updates the old once-a-second polling loop would have sent",
+                fn=lambda: {(): presence.polls_replaced})
+metrics.Gauge("bot_conversation_channels", "Channels with AI conversation memory", fn=lambda: {(): len(conversations)})
+metrics.Counter("bot_welcome_messages_total", "Welcome messages sent, one per member or one per batch", ("kind",),
+                fn=lambda: {("single",): welcomes.sent_single, ("batch",): welcomes.sent_batches})
+metrics.Counter("bot_welcome_members_total", "Joining members welcomed in a batch or dropped from a full or stale queue", ("result",),
+                fn=lambda: {("batched",): welcomes.batched_members, ("dropped",): welcomes.dropped})
+metrics.Gauge("bot_guilds", "Guilds this client is connected to", fn=lambda: {(): len(client.guilds)})
+
+# Cache of AI answers keyed on model, persona, generation config and prompt
+response_cache = ResponseCache()
+# Identical in-flight AI and image requests share one upstream call
+ai_flights = SingleFlight()
+image_flights = SingleFlight()
+# Post-processed images keyed on prompt and generation parameters
+image_cache = image_pipeline.ImageCache()
+# Recent &ask and /ask turns per channel, for guilds that turn on ai_memory
+conversations = ConversationStore()
+
+DEFAULT_PERSONA = "Talk like a casual, rowdy friend: cheeky, energetic, a bit teasing; use light slang and occasional emojis. Keep it short and helpful. No profanity, slurs, NSFW, harassment, hate, or personal attacks. Follow Discord rules."
+
+# Stream /ask and &ask replies with progressive message edits
+AI_STREAMING = os.getenv("AI_STREAMING", "1") == "1"
+
+# Upstream hosts; overridden to point at local stubs in bench/bench_load.py
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com").rstrip("/")
+STABILITY_BASE_URL = os.getenv("STABILITY_BASE_URL", "https://api.stability.ai").rstrip("/")
+
+def get_ai_settings(guild_id=None):
+    # Get server-specific settings or use defaults
+    settings = bot_settings.get(guild_id, {}) if guild_id else {}
+    model = settings.get("ai_model", "gemini-2.0-flash")
+    temperature = settings.get("ai_temperature", 0.7)
+    max_tokens = settings.get("ai_max_tokens", 500)
+    persona = settings.get("ai_persona", DEFAULT_PERSONA)
+    return model, temperature, max_tokens, persona
+
+def build_gemini_request(prompt, model, temperature, max_tokens, persona, api_key, stream=False, context=None):
+    method = "streamGenerateContent?alt=sse" if stream else "generateContent"
+    url = f"{GEMINI_BASE_URL}/v1beta/models/{model}:{method}"
+    headers = {
+        "Content-Type": "application/json",
+        "X-goog-api-key": api_key,
+    }
+    contents = []
+    if context is not None:
+        # Earlier turns in this channel: a summary in the system prompt, recent turns verbatim
+        if context.summary:
+            persona = f"{persona}\n\nSummary of the earlier conversation in this channel: {context.summary}"
+        for question, answer in context.turns:
+            contents.append({"role": "user", "parts": [{"text": question}]})
+            contents.append({"role": "model", "parts": [{"text": answer}]})
+    contents.append({"role": "user", "parts": [{"text": str(prompt)}]})
+    payload = {
+        "systemInstruction": {
+            "parts": [{"text": persona}]
+        },
+        "contents": contents,
+        "generationConfig": {
+            "temperature": float(temperature),
+            "maxOutputTokens": int(max_tokens),
+        },
+    }
+    return url, headers, payload
+
+# Seconds to pause a pool after a 429 that carries no Retry-After header
+DEFAULT_RATE_LIMIT_BACKOFF = 5
+
+def note_upstream_status(pool, api, status, retry_after):
+    metrics.upstream_errors.inc(api, str(status))
+    # Back off the whole pool when the upstream asks us to
+    seconds = retry_after or (DEFAULT_RATE_LIMIT_BACKOFF if status == 429 else None)
+    if seconds:
+        pool.backoff(seconds)
+        cooldowns.publish(pool, seconds)
+
+def ai_request_key(prompt, guild_id=None):
+    model, temperature, max_tokens, persona = get_ai_settings(guild_id)
+    return make_cache_key(model, persona, temperature, max_tokens, prompt)
+
+def ai_cache_enabled(guild_id=None):
+    # Guilds can opt out of the response cache with `&set ai_cache off`
+    return not guild_id or bot_settings.get(guild_id, {}).get("ai_cache", True)
+
+def ai_memory_enabled(guild_id=None):
+    # Conversation memory is opt-in per guild with `&set ai_memory on`
+    return bool(guild_id) and bot_settings.get(guild_id, {}).get("ai_memory", False)
+
+def conversation_context(prompt, guild_id, channel_id):
+    # Earlier turns in this channel, trimmed to the guild's ai_max_tokens; None when there are none
+    if channel_id is None or not ai_memory_enabled(guild_id):
+        return None
+    _, _, max_tokens, _ = get_ai_settings(guild_id)
+    return conversations.context(channel_id, prompt, max_tokens)
+
+def remember_turn(prompt, answer, guild_id, channel_id):
+    if channel_id is not None and answer and ai_memory_enabled(guild_id):
+        conversations.record(channel_id, prompt, answer)
 
 # AI chat function (Gemini REST API - v1beta generateContent)
-async def get_ai_response(prompt, guild_id=None):
+# Returns (ok, text); only successful answers are cached.
+async def call_gemini(prompt, guild_id=None, context=None):
     try:
-        # Get server-specific settings or use defaults
-        if guild_id and guild_id in bot_settings:
-            settings = bot_settings[guild_id]
-            model = settings.get("ai_model", "gemini-2.0-flash")
-            temperature = settings.get("ai_temperature", 0.7)
-            max_tokens = settings.get("ai_max_tokens", 500)
-            persona = settings.get(
-                "ai_persona",
-                "Talk like a casual, rowdy friend: cheeky, energetic, a bit teasing; use light slang and occasional emojis. Keep it short and helpful. No profanity, slurs, NSFW, harassment, hate, or personal attacks. Follow Discord rules."
-            )
-        else:
-            model = "gemini-2.0-flash"
-            temperature = 0.7
-            max_tokens = 500
-            persona = "Talk like a casual, rowdy friend: cheeky, energetic, a bit teasing; use light slang and occasional emojis. Keep it short and helpful. No profanity, slurs, NSFW, harassment, hate, or personal attacks. Follow Discord rules."
+        model, temperature, max_tokens, persona = get_ai_settings(guild_id)
         api_key = os.getenv("GEMINI_API_KEY")
         if not api_key:
-            return "GEMINI_API_KEY is not set."
-
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
-        headers = {
-            "Content-Type": "application/json",
-            "X-goog-api-key": api_key,
-        }
-        payload = {
-            "systemInstruction": {
-                "parts": [{"text": persona}]
-            },
-            "contents": [
-                {"parts": [{"text": str(prompt)}]}
-            ],
-            "generationConfig": {
-                "temperature": float(temperature),
-                "maxOutputTokens": int(max_tokens),
-            },
-        }
+            return (False, "GEMINI_API_KEY is not set.")
 
-        http_resp = requests.post(url, headers=headers, json=payload, timeout=60)
-        if http_resp.status_code != 200:
-            return f"Gemini API error: {http_resp.status_code} {http_resp.text}"
-        data = http_resp.json()
+        url, headers, payload = build_gemini_request(prompt, model, temperature, max_tokens, persona, api_key, context=context)
+        with metrics.upstream("gemini"):
+            status, data, retry_after = await http_client.post_json(url, headers, payload, http_client.GEMINI_TIMEOUT)
+        if status != 200:
+            note_upstream_status(text_pool, "gemini", status, retry_after)
+            return (False, f"Gemini API error: {status} {data}")
         # Extract first candidate text
         try:
-            return data["candidates"][0]["content"]["parts"][0]["text"]
+            return (True, data["candidates"][0]["content"]["parts"][0]["text"])
         except Exception:
-            return str(data)
+            return (False, str(data))
+    except Exception as e:
+        metrics.upstream_errors.inc("gemini", "exception")
+        return (False, f"Sorry, I encountered an error: {str(e)}")
+
+async def get_ai_response(prompt, guild_id=None, user_id=None, channel_id=None):
+    context = conversation_context(prompt, guild_id, channel_id)
+    if context is not None:
+        # A follow-up depends on the channel's history, so it is neither cached nor coalesced
+        try:
+            async with text_pool.slot(guild_id, user_id):
+                ok, text = await call_gemini(prompt, guild_id, context)
+        except PoolBusy as e:
+            return str(e)
+        if ok:
+            remember_turn(prompt, text, guild_id, channel_id)
+        return text
+
+    key = ai_request_key(prompt, guild_id)
+    use_cache = ai_cache_enabled(guild_id)
+    if use_cache:
+        cached = await response_cache.get(key)
+        if cached is not None:
+            remember_turn(prompt, cached, guild_id, channel_id)
+            return cached
+
+    async def fetch():
+        try:
+            async with text_pool.slot(guild_id, user_id):
+                ok, text = await call_gemini(prompt, guild_id)
+        except PoolBusy as e:
+            return False, str(e)
+        if ok and use_cache and text:
+            await response_cache.set(key, text)
+        return ok, text
+
+    # Identical questions already in flight share one upstream call
+    ok, text = await ai_flights.do(key, fetch)
+    if ok:
+        remember_turn(prompt, text, guild_id, channel_id)
+    return text
+
+# Streaming variant (streamGenerateContent over SSE); yields text as it arrives
+async def stream_ai_response(prompt, guild_id, api_key, context=None):
+    model, temperature, max_tokens, persona = get_ai_settings(guild_id)
+    url, headers, payload = build_gemini_request(prompt, model, temperature, max_tokens, persona, api_key, stream=True, context=context)
+    try:
+        with metrics.upstream("gemini_stream"):
+            async for event in http_client.stream_sse(url, headers, payload, http_client.GEMINI_TIMEOUT):
+                for candidate in event.get("candidates", [])[:1]:
+                    for part in candidate.get("content", {}).get("parts", []):
+                        if part.get("text"):
+                            yield part["text"]
+    except http_client.UpstreamError as e:
+        note_upstream_status(text_pool, "gemini_stream", e.status, e.retry_after)
+        raise
+    except Exception:
+        metrics.upstream_errors.inc("gemini_stream", "exception")
+        raise
+
+async def stream_answer(question, guild_id, reply, user_id=None, channel_id=None):
+    context = conversation_context(question, guild_id, channel_id)
+    key = ai_request_key(question, guild_id)
+    # Follow-ups depend on the channel's history, so they skip the cache
+    use_cache = context is None and ai_cache_enabled(guild_id)
+    cached = await response_cache.get(key) if use_cache else None
+    if cached is not None:
+        await reply.feed(cached)
+        remember_turn(question, cached, guild_id, channel_id)
+        return await reply.finish()
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        await reply.feed("GEMINI_API_KEY is not set.")
+        return await reply.finish()
+
+    async def produce():
+        parts = []
+        async with text_pool.slot(guild_id, user_id):
+            async for delta in stream_ai_response(question, guild_id, api_key, context):
+                parts.append(delta)
+                yield delta
+        text = "".join(parts)
+        if use_cache and text.strip():
+            await response_cache.set(key, text)
+
+    answer = []
+    try:
+        # Identical questions already streaming replay the same chunks;
+        # follow-ups have their own history and stream on their own
+        stream = produce() if context is not None else ai_flights.stream(key, produce)
+        async for delta in stream:
+            answer.append(delta)
+            await reply.feed(delta)
+        remember_turn(question, "".join(answer), guild_id, channel_id)
+    except PoolBusy as e:
+        await reply.feed(str(e))
+    except http_client.UpstreamError as e:
+        await reply.feed(f"Gemini API error: {e.status} {e.text}")
     except Exception as e:
-        return f"Sorry, I encountered an error: {str(e)}"
+        await reply.feed(f"\nSorry, I encountered an error: {str(e)}")
+    return await reply.finish()
+
+IMAGE_ENGINE = "stable-diffusion-xl-1024-v1-0"
+# Buttons under a multi-image grid to fetch a single full-size variant
+IMAGE_VARIANT_BUTTONS = os.getenv("IMAGE_VARIANT_BUTTONS", "1") == "1"
+IMAGE_VIEW_TIMEOUT = float(os.getenv("IMAGE_VIEW_TIMEOUT", "600"))
 
-async def generate_image(prompt, guild_id=None):
+def image_request_key(prompt, params):
+    raw = json.dumps([IMAGE_ENGINE, str(prompt).strip(), params], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+async def call_stability(prompt, params):
     try:
         # Stable Diffusion via Stability AI REST API (single fixed model)
-        engine = "stable-diffusion-xl-1024-v1-0"
+        engine = IMAGE_ENGINE
         stability_key = os.getenv("STABILITY_API_KEY")
         if not stability_key:
             return (False, "STABILITY_API_KEY is not set.")
-        url = f"https://api.stability.ai/v1/generation/{engine}/text-to-image"
+        url = f"{STABILITY_BASE_URL}/v1/generation/{engine}/text-to-image"
         headers = {
             "Authorization": f"Bearer {stability_key}",
             "Content-Type": "application/json",
             "Accept": "application/json",
         }
-        payload = {
-            "text_prompts": [{"text": str(prompt)}],
-            "cfg_scale": 7,
-            "height": 1024,
-            "width": 1024,
-            "samples": 1,
-            "steps": 30,
-        }
-        http_resp = requests.post(url, headers=headers, json=payload, timeout=90)
-        if http_resp.status_code != 200:
-            return (False, f"Stability API error: {http_resp.status_code} {http_resp.text}")
-        data = http_resp.json()
+        payload = {"text_prompts": [{"text": str(prompt)}], **params}
+        with metrics.upstream("stability"):
+            status, data, retry_after = await http_client.post_json(url, headers, payload, http_client.STABILITY_TIMEOUT)
+        if status != 200:
+            note_upstream_status(image_pool, "stability", status, retry_after)
+            return (False, f"Stability API error: {status} {data}")
         artifacts = data.get("artifacts", [])
         if not artifacts:
             return (False, str(data))
-        b64 = artifacts[0].get("base64")
-        if not b64:
+        b64_list = [a["base64"] for a in artifacts if a.get("base64")]
+        if not b64_list:
             return (False, "No image data returned.")
-        image_bytes = base64.b64decode(b64)
-        return (True, image_bytes)
+        # Decoding happens in the image pipeline, off the event loop
+        return (True, b64_list)
     except Exception as e:
+        metrics.upstream_errors.inc("stability", "exception")
         return (False, f"Sorry, I couldn't generate an image: {str(e)}")
 
-async def update_presence(client):
-    global last_command_time
-    while True:
-        if last_command_time is None:
-            # The bot is idle
-            await client.change_presence(status=discord.Status.idle,
-            activity = discord.Activity(type=discord.ActivityType.playing, name = "Dynamically"))
-        else:
-            current_time = time.time()
-            if current_time - last_command_time > 120:
-                # No one has used a command in the last 2 minutes
-                last_command_time = None
-                await client.change_presence(status=discord.Status.idle,
-                activity = discord.Activity(type=discord.ActivityType.playing, name = "Dynamically"))
-            else:
-                await client.change_presence(status=discord.Status.online,
-                activity = discord.Activity(type=discord.ActivityType.listening, name = "help"))
-        await asyncio.sleep(1)
+# Returns (True, ImageBatch) or (False, error message). Several samples come
+# back from one Stability call and are uploaded as a single grid image.
+async def generate_image(prompt, guild_id=None, user_id=None, count=1):
+    params = {
+        "cfg_scale": 7,
+        "height": 1024,
+        "width": 1024,
+        "samples": int(count),
+        "steps": 30,
+    }
+
+    request_key = image_request_key(prompt, params)
+    cache_key = image_pipeline.cache_key(request_key)
+    # Repeat prompts are served from the local disk cache
+    cached = await image_cache.get_batch(cache_key, count)
+    if cached is not None:
+        return (True, cached._replace(key=cache_key))
+
+    async def fetch():
+        try:
+            async with image_pool.slot(guild_id, user_id):
+                ok, result = await call_stability(prompt, params)
+        except PoolBusy as e:
+            return (False, str(e))
+        if not ok:
+            return (False, result)
+        try:
+            batch = await image_pipeline.render_batch(result)
+        except Exception as e:
+            return (False, f"Sorry, I couldn't process the image: {str(e)}")
+        try:
+            await image_cache.put_batch(cache_key, batch)
+        except OSError as e:
+            print(f"Failed to cache image: {e}")
+            return (True, batch)
+        return (True, batch._replace(key=cache_key) if image_cache.enabled else batch)
+
+    # Identical prompts already in flight share one upstream call and its (ok, image) result
+    return await image_flights.do(request_key, fetch)
+
+def image_file(rendered, size_limit=None):
+    # Fall back to the preview when the full image is over the upload limit
+    if size_limit and len(rendered.data) > size_limit and rendered.preview:
+        return discord.File(io.BytesIO(rendered.preview), filename=rendered.preview_filename)
+    return discord.File(io.BytesIO(rendered.data), filename=rendered.filename)
+
+class VariantView(discord.ui.View):
+    # One button per variant; clicking loads that variant from the image cache
+    # and sends it at full size. Only the cache key is held while the view is open.
+    def __init__(self, key, count, size_limit=None):
+        super().__init__(timeout=IMAGE_VIEW_TIMEOUT)
+        self.key = key
+        self.size_limit = size_limit
+        for i in range(count):
+            button = discord.ui.Button(label=f"V{i + 1}", style=discord.ButtonStyle.secondary)
+            button.callback = self._make_callback(i)
+            self.add_item(button)
+
+    def _make_callback(self, index):
+        async def callback(interaction: discord.Interaction):
+            variant = await image_cache.get(f"{self.key}-{index + 1}", count=False)
+            if variant is None:
+                await interaction.response.send_message("That variant has expired, try generating the image again.", ephemeral=True)
+                return
+            variant = variant._replace(filename=f"variant-{index + 1}.{variant.filename.rsplit('.', 1)[-1]}")
+            await interaction.response.send_message(file=image_file(variant, self.size_limit), ephemeral=True)
+        return callback
+
+def image_message(batch, size_limit=None):
+    # Keyword arguments for a send(): one grid plus variant buttons, or a single image
+    if len(batch.variants) == 1:
+        return {"file": image_file(batch.variants[0], size_limit)}
+    if batch.image is None:
+        # No grid without Pillow; attach the variants side by side instead
+        return {"files": [image_file(v, size_limit) for v in batch.variants]}
+    kwargs = {"file": image_file(batch.image, size_limit)}
+    if IMAGE_VARIANT_BUTTONS and batch.key is not None:
+        # Buttons need the variants in the image cache; without it only the grid is sent
+        kwargs["view"] = VariantView(batch.key, len(batch.variants), size_limit)
+    return kwargs
 
 @client.event
 async def on_ready():
-    print(f"Logged in as {client.user}!")
-    # Start the presence update loop
-    client.loop.create_task(update_presence(client))
-    # Sync slash commands
-    try:
-        # 1) For each guild: wipe existing guild-specific commands so only global remain
-        for guild in client.guilds:
-            gobj = discord.Object(id=guild.id)
-            try:
-                existing_guild_cmds = await tree.fetch_commands(guild=gobj)
-                if existing_guild_cmds:
-                    for cmd in existing_guild_cmds:
-                        try:
-                            await tree.delete_command(cmd.id, guild=gobj)
-                        except Exception:
-                            pass
-            except Exception:
-                pass
-            # Ensure guild has no per-guild commands
-            await tree.sync(guild=gobj)
-        # 2) Register only GLOBAL commands to avoid duplicates
-        synced = await tree.sync()
-        print(f"Slash commands globally synced: {len(synced)} commands. Guilds cleaned: {len(client.guilds)}")
-    except Exception as e:
-        print(f"Failed to sync slash commands: {e}")
+    with metrics.track("event", "on_ready"):
+        print(f"Logged in as {client.user} ({shards.describe()})!")
+        # (Re)send the current presence for this gateway session
+        presence.start()
+        # Sync slash commands only when the local command tree changed;
+        # stale guild commands are cleaned up in the background
+        try:
+            await command_sync.run(client)
+        except Exception as e:
+            print(f"Failed to sync slash commands: {e}")
 
 @tree.command(name="ask", description="Ask the AI assistant anything")
 @app_commands.describe(question="Your question for the AI")
 async def slash_ask(interaction: discord.Interaction, question: str):
     # Show the thinking indicator
     await interaction.response.defer(thinking=True)
-    reply = await get_ai_response(question, interaction.guild.id if interaction.guild else None)
+    guild_id = interaction.guild.id if interaction.guild else None
+    if AI_STREAMING:
+        # Fill the deferred "thinking" message in place, then roll over into followups
+        reply = StreamingReply(
+            send=lambda content: interaction.followup.send(content, wait=True),
+            send_first=lambda content: interaction.edit_original_response(content=content),
+        )
+        await stream_answer(question, guild_id, reply, user_id=interaction.user.id, channel_id=interaction.channel_id)
+        return
+    reply = await get_ai_response(question, guild_id, user_id=interaction.user.id, channel_id=interaction.channel_id)
     if not reply:
         reply = "Sorry, I couldn't generate a response."
-    if len(reply) > 2000:
-        for i in range(0, len(reply), 1990):
-            await interaction.followup.send(reply[i:i+1990])
-    else:
-        await interaction.followup.send(reply)
+    with metrics.discord_send_seconds.time("text"):
+        if len(reply) > 2000:
+            for i in range(0, len(reply), 1990):
+                await interaction.followup.send(reply[i:i+1990])
+        else:
+            await interaction.followup.send(reply)
 
 @tree.command(name="imagine", description="Generate an image from a prompt")
-@app_commands.describe(prompt="Describe the image you want")
-async def slash_imagine(interaction: discord.Interaction, prompt: str):
+@app_commands.describe(prompt="Describe the image you want", count=f"Number of variants (1-{MAX_IMAGE_COUNT})")
+async def slash_imagine(interaction: discord.Interaction, prompt: str, count: app_commands.Range[int, 1, MAX_IMAGE_COUNT] = 1):
     await interaction.response.defer(thinking=True)
-    ok, result = await generate_image(prompt, interaction.guild.id if interaction.guild else None)
+    ok, result = await generate_image(parse_prompt(prompt), interaction.guild.id if interaction.guild else None, user_id=interaction.user.id, count=check_image_count(count))
     if not ok:
         await interaction.followup.send(str(result))
     else:
-        file = discord.File(io.BytesIO(result), filename="image.png")
-        await interaction.followup.send(file=file)
+        with metrics.discord_send_seconds.time("image"):
+            await interaction.followup.send(**image_message(result, interaction.guild.filesize_limit if interaction.guild else None))
 
 @tree.command(name="hello", description="Say hi")
 async def slash_hello(interaction: discord.Interaction):
@@ -204,16 +557,40 @@ async def slash_setwelcome(interaction: discord.Interaction, channel: discord.Te
     if not interaction.user.guild_permissions.administrator:  # type: ignore[attr-defined]
         await interaction.response.send_message("You have to be an admin to set the welcome channel.", ephemeral=True)
         return
-    welcome_channels[interaction.guild.id] = channel  # type: ignore[union-attr]
+    store.set_welcome_channel(interaction.guild.id, channel.id)  # type: ignore[union-attr]
     await interaction.response.send_message(f"Welcome channel set to {channel.mention}.")
 
 @tree.command(name="getwelcomechannel", description="Show the current welcome channel")
 async def slash_getwelcome(interaction: discord.Interaction):
-    channel = welcome_channels.get(interaction.guild.id if interaction.guild else 0)
-    if channel is None:
+    channel_id = welcome_channels.get(interaction.guild.id if interaction.guild else 0)
+    if channel_id is None:
         await interaction.response.send_message("Welcome channel is not set.")
     else:
-        await interaction.response.send_message(f"Welcome channel is set to {channel.mention}.")
+        await interaction.response.send_message(f"Welcome channel is set to <#{channel_id}>.")
+
+def apply_setting(guild_id, option, value):
+    # Validates and stores a setting; returns the confirmation message
+    key, parsed, confirmation = parse_setting(option, value)
+    # Initialize settings for this server if not exists
+    bot_settings.setdefault(guild_id, dict(DEFAULT_SETTINGS))[key] = parsed
+    store.mark_settings_dirty(guild_id)
+    if key == "prefix":
+        router.set_prefix(guild_id, parsed)
+    return confirmation
+
+def build_settings_embed(guild, settings):
+    embed = discord.Embed(title="Bot Settings", description=f"Current settings for **{guild.name}**", color=0x00ff00)
+    embed.add_field(name="Prefix", value=f"`{settings.get('prefix', '&')}`", inline=True)
+    embed.add_field(name="AI Model", value=f"`{settings.get('ai_model', 'gemini-2.0-flash')}`", inline=True)
+    embed.add_field(name="AI Temperature", value=f"`{settings.get('ai_temperature', 0.7)}`", inline=True)
+    embed.add_field(name="AI Max Tokens", value=f"`{settings.get('ai_max_tokens', 500)}`", inline=True)
+    persona_preview_full = settings.get('ai_persona', '')
+    persona_preview = (persona_preview_full[:80] + '…') if len(persona_preview_full) > 80 else (persona_preview_full or 'default rowdy persona')
+    embed.add_field(name="AI Persona", value=f"`{persona_preview}`", inline=False)
+    embed.add_field(name="AI Cache", value=f"`{'on' if settings.get('ai_cache', True) else 'off'}`", inline=True)
+    embed.add_field(name="AI Memory", value=f"`{'on' if settings.get('ai_memory', False) else 'off'}`", inline=True)
+    # Image settings are fixed to Stability SDXL
+    return embed
 
 @tree.command(name="settings", description="View current bot settings (Admin only)")
 async def slash_settings(interaction: discord.Interaction):
@@ -221,212 +598,209 @@ async def slash_settings(interaction: discord.Interaction):
         await interaction.response.send_message("You have to be an admin to view bot settings.", ephemeral=True)
         return
     if interaction.guild and interaction.guild.id in bot_settings:
-        settings = bot_settings[interaction.guild.id]
-        embed = discord.Embed(title="Bot Settings", description=f"Current settings for **{interaction.guild.name}**", color=0x00ff00)
-        embed.add_field(name="Prefix", value=f"`{settings.get('prefix', '&')}`", inline=True)
-        embed.add_field(name="AI Model", value=f"`{settings.get('ai_model', 'gemini-1.5-flash')}`", inline=True)
-        embed.add_field(name="AI Temperature", value=f"`{settings.get('ai_temperature', 0.7)}`", inline=True)
-        embed.add_field(name="AI Max Tokens", value=f"`{settings.get('ai_max_tokens', 500)}`", inline=True)
+        embed = build_settings_embed(interaction.guild, bot_settings[interaction.guild.id])
         await interaction.response.send_message(embed=embed)
     else:
         await interaction.response.send_message("No custom settings found. Using default settings.")
 
+@tree.command(name="set", description="Change a bot setting (Admin only)")
+@app_commands.describe(option="Setting to change", value="New value")
+@app_commands.choices(option=[app_commands.Choice(name=o, value=o) for o in SETTING_OPTIONS])
+async def slash_set(interaction: discord.Interaction, option: str, value: str):
+    if not interaction.guild or not interaction.user.guild_permissions.administrator:  # type: ignore[attr-defined]
+        await interaction.response.send_message("You have to be an admin to change bot settings.", ephemeral=True)
+        return
+    try:
+        await interaction.response.send_message(apply_setting(interaction.guild.id, option, value))
+    except ArgumentError as e:
+        await interaction.response.send_message(str(e), ephemeral=True)
+
+@tree.command(name="forget", description="Clear the AI conversation memory for this channel")
+async def slash_forget(interaction: discord.Interaction):
+    forgotten = conversations.forget(interaction.channel_id)
+    await interaction.response.send_message("Conversation memory cleared for this channel." if forgotten else "Nothing to forget in this channel.")
+
 @tree.command(name="help", description="Show available commands")
 async def slash_help(interaction: discord.Interaction):
-    embed = await get_help_embed(interaction.user)
+    embed = await get_help_embed(interaction.user, router.prefix(interaction.guild.id if interaction.guild else None))
     await interaction.response.send_message(embed=embed)
 
 @client.event
 async def on_guild_join(guild: discord.Guild):
-    # Ensure slash commands appear immediately when the bot joins a new guild
+    with metrics.track("event", "on_guild_join"):
+        # Global commands already cover the new guild; only clear stale guild commands
+        if await command_sync.clean_guild(guild.id):
+            print(f"Stale slash commands cleared in new guild: {guild.id}")
+
+# Prefix commands: each handler takes (message, args)
+router = CommandRouter(prefix)
+
+@router.command("setwelcomechannel")
+async def cmd_setwelcomechannel(message, args):
+    # Check if the user is an admin
+    if not message.author.guild_permissions.administrator:
+        await message.channel.send("You have to be an admin to set the welcome channel.")
+        return
+    # Set the welcome channel for the current server
+    store.set_welcome_channel(message.guild.id, message.channel.id)
+    await message.channel.send(f"Welcome channel set to {message.channel.name}.")
+
+@router.command("getwelcomechannel")
+async def cmd_getwelcomechannel(message, args):
+    # Check if the welcome channel has been set for the current server
+    channel_id = welcome_channels.get(message.guild.id)
+    if channel_id is None:
+        await message.channel.send("Welcome channel is not set.")
+    else:
+        welcome_channel = get_welcome_channel(message.guild.id)
+        await message.channel.send(f"Welcome channel is set to {welcome_channel.name if welcome_channel else f'<#{channel_id}>'}.")
+
+@router.command("hello")
+async def cmd_hello(message, args):
+    await message.channel.send("Hii!")
+
+@router.command("mf")
+async def cmd_mf(message, args):
+    await message.reply("latom!",mention_author=True)
+
+@router.command("forget")
+async def cmd_forget(message, args):
+    forgotten = conversations.forget(message.channel.id)
+    await message.channel.send("Conversation memory cleared for this channel." if forgotten else "Nothing to forget in this channel.")
+
+@router.command("help")
+async def cmd_help(message, args):
+    embed = await get_help_embed(message.author, router.prefix(message.guild.id if message.guild else None))
+    await message.channel.send(embed=embed)
+
+@router.command("imagine")
+async def cmd_imagine(message, args):
     try:
-        await tree.sync(guild=guild)
-        print(f"Slash commands synced to new guild: {guild.id}")
-    except Exception as e:
-        print(f"Failed syncing to new guild {guild.id}: {e}")
+        img_prompt, count = parse_imagine_args(args)
+    except ArgumentError as e:
+        await message.channel.send(str(e))
+        return
+    if not img_prompt:
+        await message.channel.send(f"Please provide a prompt! Usage: `{router.prefix(message.guild.id if message.guild else None)}imagine [--count N] your prompt`")
+        return
+    async with message.channel.typing():
+        ok, result = await generate_image(img_prompt, message.guild.id if message.guild else None, user_id=message.author.id, count=count)
+        if not ok:
+            await message.channel.send(str(result))
+        else:
+            with metrics.discord_send_seconds.time("image"):
+                await message.channel.send(**image_message(result, message.guild.filesize_limit if message.guild else None))
 
-@client.event
-async def on_message(message):
-    global last_command_time
-    if message.content.startswith(prefix):
-        command = message.content[len(prefix):]
-
-        # Set welcome channel command
-        if command.startswith("setwelcomechannel"):
-            # Check if the user is an admin
-            if not message.author.guild_permissions.administrator:
-                await message.channel.send("You have to be an admin to set the welcome channel.")
-                return
-            # Set the welcome channel for the current server
-            welcome_channels[message.guild.id] = message.channel
-            await message.channel.send(f"Welcome channel set to {message.channel.name}.")
-
-        # Get welcome channel command
-        if command.startswith("getwelcomechannel"):
-            # Check if the welcome channel has been set for the current server
-            welcome_channel = welcome_channels.get(message.guild.id)
-            if welcome_channel is None:
-                await message.channel.send("Welcome channel is not set.")
-            else:
-                await message.channel.send(f"Welcome channel is set to {welcome_channel.name}.")
-        if command.startswith("hello"):
-            await message.channel.send("Hii!")
-        if command.startswith("mf"):
-            await message.reply("latom!",mention_author=True)
-        if command.startswith("help"):
-            embed = await get_help_embed(message.author)
-            await message.channel.send(embed=embed)
-        if command.startswith("imagine"):
-            img_prompt = command[len("imagine"):].strip()
-            if not img_prompt:
-                await message.channel.send("Please provide a prompt! Usage: `&imagine your prompt`")
-                return
-            async with message.channel.typing():
-                ok, result = await generate_image(img_prompt, message.guild.id if message.guild else None)
-                if not ok:
-                    await message.channel.send(str(result))
-                else:
-                    file = discord.File(io.BytesIO(result), filename="image.png")
-                    await message.channel.send(file=file)
-        
-        # AI chat command
-        if command.startswith("ask"):
-            # Extract the question from the command
-            question = command[4:].strip()  # Remove "ask " from the beginning
-            if not question:
-                await message.channel.send("Please provide a question! Usage: `&ask your question here`")
-                return
-            
-            # Show typing indicator while processing
-            async with message.channel.typing():
-                response = await get_ai_response(question, message.guild.id)
-                # Send only the AI's reply without any prefix or the asked question
-                if not response:
-                    response = "Sorry, I couldn't generate a response."
-                # Discord message limit is 2000 characters; chunk if needed
+# AI chat command
+@router.command("ask")
+async def cmd_ask(message, args):
+    question = parse_prompt(args)
+    if not question:
+        await message.channel.send(f"Please provide a question! Usage: `{router.prefix(message.guild.id)}ask your question here`")
+        return
+
+    # Show typing indicator while processing
+    async with message.channel.typing():
+        if AI_STREAMING:
+            await stream_answer(question, message.guild.id, StreamingReply(send=message.channel.send), user_id=message.author.id, channel_id=message.channel.id)
+        else:
+            response = await get_ai_response(question, message.guild.id, user_id=message.author.id, channel_id=message.channel.id)
+            # Send only the AI's reply without any prefix or the asked question
+            if not response:
+                response = "Sorry, I couldn't generate a response."
+            # Discord message limit is 2000 characters; chunk if needed
+            with metrics.discord_send_seconds.time("text"):
                 if len(response) > 2000:
                     for i in range(0, len(response), 1990):
                         await message.channel.send(response[i:i+1990])
                 else:
                     await message.channel.send(response)
-        
-        # Set command for bot configuration
-        if command.startswith("set"):
-            # Check if the user is an admin
-            if not message.author.guild_permissions.administrator:
-                await message.channel.send("You have to be an admin to change bot settings.")
-                return
-            
-            # Parse the set command
-            set_args = command[4:].strip().split()  # Remove "set " and split arguments
-            if len(set_args) < 2:
-                await message.channel.send("Usage: `&set <option> <value>`\nAvailable options: `prefix`, `ai_model`, `ai_temperature`, `ai_max_tokens`, `ai_persona`")
-                return
-            
-            option = set_args[0].lower()
-            value = " ".join(set_args[1:])
-            
-            # Initialize settings for this server if not exists
-            if message.guild.id not in bot_settings:
-                bot_settings[message.guild.id] = {
-                    "prefix": "&",
-                    "ai_model": "gemini-2.0-flash",
-                    "ai_temperature": 0.7,
-                    "ai_max_tokens": 500
-                }
-            
-            # Handle different setting options
-            if option == "prefix":
-                if len(value) > 3:
-                    await message.channel.send("Prefix must be 3 characters or less.")
-                    return
-                bot_settings[message.guild.id]["prefix"] = value
-                await message.channel.send(f"Bot prefix set to: `{value}`")
-                
-            elif option == "ai_model":
-                valid_models = [
-                    "gemini-2.0-flash",
-                    "gemini-2.0-pro",
-                ]
-                if value not in valid_models:
-                    await message.channel.send(f"Invalid AI model. Available models: {', '.join(valid_models)}")
-                    return
-                bot_settings[message.guild.id]["ai_model"] = value
-                await message.channel.send(f"AI model set to: `{value}`")
-                
-            elif option == "ai_temperature":
-                try:
-                    temp = float(value)
-                    if temp < 0 or temp > 2:
-                        await message.channel.send("Temperature must be between 0 and 2.")
-                        return
-                    bot_settings[message.guild.id]["ai_temperature"] = temp
-                    await message.channel.send(f"AI temperature set to: `{temp}`")
-                except ValueError:
-                    await message.channel.send("Temperature must be a number between 0 and 2.")
-                    
-            elif option == "ai_max_tokens":
-                try:
-                    tokens = int(value)
-                    if tokens < 50 or tokens > 2000:
-                        await message.channel.send("Max tokens must be between 50 and 2000.")
-                        return
-                    bot_settings[message.guild.id]["ai_max_tokens"] = tokens
-                    await message.channel.send(f"AI max tokens set to: `{tokens}`")
-                except ValueError:
-                    await message.channel.send("Max tokens must be a number between 50 and 2000.")
-            
-            elif option == "ai_persona":
-                if len(value) > 800:
-                    await message.channel.send("Persona is too long (max 800 characters).")
-                    return
-                bot_settings[message.guild.id]["ai_persona"] = value
-                await message.channel.send("AI persona updated.")
-                    
-            elif option in ("image_model", "image_provider"):
-                await message.channel.send("Image generation is fixed to Stability SDXL; no image settings to change.")
-
-            else:
-                await message.channel.send("Unknown setting. Available options: `prefix`, `ai_model`, `ai_temperature`, `ai_max_tokens`")
-        
-        # View settings command
-        if command.startswith("settings"):
-            # Check if the user is an admin
-            if not message.author.guild_permissions.administrator:
-                await message.channel.send("You have to be an admin to view bot settings.")
-                return
-            
-            # Get current settings for this server
-            if message.guild.id in bot_settings:
-                settings = bot_settings[message.guild.id]
-                embed = discord.Embed(title="Bot Settings", description=f"Current settings for **{message.guild.name}**", color=0x00ff00)
-                embed.add_field(name="Prefix", value=f"`{settings.get('prefix', '&')}`", inline=True)
-                embed.add_field(name="AI Model", value=f"`{settings.get('ai_model', 'gemini-2.0-flash')}`", inline=True)
-                embed.add_field(name="AI Temperature", value=f"`{settings.get('ai_temperature', 0.7)}`", inline=True)
-                embed.add_field(name="AI Max Tokens", value=f"`{settings.get('ai_max_tokens', 500)}`", inline=True)
-                persona_preview_full = settings.get('ai_persona', '')
-                persona_preview = (persona_preview_full[:80] + '…') if len(persona_preview_full) > 80 else (persona_preview_full or 'default rowdy persona')
-                embed.add_field(name="AI Persona", value=f"`{persona_preview}`", inline=False)
-                # Image settings are fixed to Stability SDXL
-                embed.set_footer(text=f"Requested by {message.author.name}", icon_url=message.author.avatar)
-                await message.channel.send(embed=embed)
-            else:
-                await message.channel.send("No custom settings found. Using default settings.")
-        
-        #update the last command time
-        last_command_time = time.time()
+
+# Set command for bot configuration
+@router.command("set")
+async def cmd_set(message, args):
+    # Check if the user is an admin
+    if not message.author.guild_permissions.administrator:
+        await message.channel.send("You have to be an admin to change bot settings.")
+        return
+    try:
+        option, value = parse_set_args(args, router.prefix(message.guild.id))
+        await message.channel.send(apply_setting(message.guild.id, option, value))
+    except ArgumentError as e:
+        await message.channel.send(str(e))
+
+# View settings command
+@router.command("settings")
+async def cmd_settings(message, args):
+    # Check if the user is an admin
+    if not message.author.guild_permissions.administrator:
+        await message.channel.send("You have to be an admin to view bot settings.")
+        return
+    # Get current settings for this server
+    if message.guild.id in bot_settings:
+        embed = build_settings_embed(message.guild, bot_settings[message.guild.id])
+        embed.set_footer(text=f"Requested by {message.author.name}", icon_url=message.author.avatar)
+        await message.channel.send(embed=embed)
+    else:
+        await message.channel.send("No custom settings found. Using default settings.")
+
+# Memory report (Admin only): &memory [start|stop|top N]
+@router.command("memory")
+async def cmd_memory(message, args):
+    if not message.author.guild_permissions.administrator:
+        await message.channel.send("You have to be an admin to view the memory report.")
+        return
+    usage = f"Usage: `{router.prefix(message.guild.id)}memory [start|stop|top N]`"
+    parts = args.split()
+    action = parts[0].lower() if parts else "top"
+    if action == "start":
+        started = memreport.start_tracing()
+        await message.channel.send("Allocation tracing started." if started else "Allocation tracing is already on.")
+    elif action == "stop":
+        stopped = memreport.stop_tracing()
+        await message.channel.send("Allocation tracing stopped." if stopped else "Allocation tracing is already off.")
+    elif action == "top":
+        try:
+            limit = max(1, min(25, int(parts[1]))) if len(parts) > 1 else 10
+        except ValueError:
+            await message.channel.send(usage)
+            return
+        # Snapshots can take a while on big heaps; keep them off the event loop
+        text = memreport.summary(client) + "\n" + await asyncio.to_thread(memreport.top_allocations, limit)
+        await message.channel.send(f"```\n{text[:1980]}\n```")
+    else:
+        await message.channel.send(usage)
+
+@client.event
+async def on_app_command_completion(interaction, command):
+    record_slash_command(interaction, command)
+
+@client.event
+async def on_interaction(interaction):
+    with metrics.track("event", "on_interaction"):
+        # Slash commands count as activity too
+        if interaction.type == discord.InteractionType.application_command:
+            presence.touch()
+
+@client.event
+async def on_message(message):
+    with metrics.track("event", "on_message"):
+        if message.author.bot:
+            return
+        route = router.resolve(message.content, message.guild.id if message.guild else None)
+        if route is None:
+            return
+        handler, name, args = route
+        presence.touch()
+        with metrics.track("command", name):
+            await handler(message, args)
 
 @client.event
 async def on_member_join(member):
-    # Get the welcome channel for the server the user is joining
-    welcome_channel = welcome_channels.get(member.guild.id)
-    # Send the welcome message
-    if welcome_channel:
-        embed = discord.Embed(title="Welcome!", description=f"Ara ara! {member.mention}, welcome to **{member.guild.name}**! Hope you find Peace here.", color=0xfc30ff)
-        embed.set_image(url= 'https://cdn.discordapp.com/attachments/998612463492812822/1063409897871511602/welcome.png')
-        embed.set_thumbnail(url= member.avatar)
-        embed.set_footer(text=f"{member.name} joined!") #icon_url= member.avatar
-        await welcome_channel.send(embed=embed)
-
-tracemalloc.start()
-client.run(token)
+    with metrics.track("event", "on_member_join"):
+        # Sent to the server's welcome channel, if one is set
+        await welcomes.member_joined(member)
+
+# Imported without running by the load test harness in bench/
+if __name__ == "__main__":
+    client.run(token)
@@ -0,0 +1,111 @@
+# Argument parsing shared by the prefix commands and the slash commands
+
+SETTING_OPTIONS = ["prefix", "ai_model", "ai_temperature", "ai_max_tokens", "ai_persona", "ai_cache", "ai_memory"]
+VALID_MODELS = [
+    "gemini-2.0-flash",
+    "gemini-2.0-pro",
+]
+
+# Variants per /imagine request (Stability "samples")
+MAX_IMAGE_COUNT = 4
+
+DEFAULT_SETTINGS = {
+    "prefix": "&",
+    "ai_model": "gemini-2.0-flash",
+    "ai_temperature": 0.7,
+    "ai_max_tokens": 500,
+}
+
+
+class ArgumentError(ValueError):
+    # The message is shown to the user as-is
+    pass
+
+
+def parse_prompt(args):
+    return (args or "").strip()
+
+
+def check_image_count(count):
+    if count < 1 or count > MAX_IMAGE_COUNT:
+        raise ArgumentError(f"Count must be between 1 and {MAX_IMAGE_COUNT}.")
+    return count
+
+
+def parse_imagine_args(args):
+    # "[--count N | -n N] prompt..." -> (prompt, count) or raises ArgumentError
+    parts = (args or "").strip().split(None, 2)
+    count = 1
+    if parts and parts[0] in ("--count", "-n"):
+        if len(parts) < 2:
+            raise ArgumentError(f"Count must be between 1 and {MAX_IMAGE_COUNT}.")
+        try:
+            count = int(parts[1])
+        except ValueError:
+            raise ArgumentError(f"Count must be between 1 and {MAX_IMAGE_COUNT}.")
+        args = parts[2] if len(parts) > 2 else ""
+    return parse_prompt(args), check_image_count(count)
+
+
+def parse_setting(option, value):
+    # Returns (key, parsed value, confirmation message) or raises ArgumentError
+    option = option.lower()
+    value = value.strip()
+    if option == "prefix":
+        if not value or len(value) > 3:
+            raise ArgumentError("Prefix must be 3 characters or less.")
+        return "prefix", value, f"Bot prefix set to: `{value}`"
+
+    if option == "ai_model":
+        if value not in VALID_MODELS:
+            raise ArgumentError(f"Invalid AI model. Available models: {', '.join(VALID_MODELS)}")
+        return "ai_model", value, f"AI model set to: `{value}`"
+
+    if option == "ai_temperature":
+        try:
+            temp = float(value)
+        except ValueError:
+            raise ArgumentError("Temperature must be a number between 0 and 2.")
+        if temp < 0 or temp > 2:
+            raise ArgumentError("Temperature must be between 0 and 2.")
+        return "ai_temperature", temp, f"AI temperature set to: `{temp}`"
+
+    if option == "ai_max_tokens":
+        try:
+            tokens = int(value)
+        except ValueError:
+            raise ArgumentError("Max tokens must be a number between 50 and 2000.")
+        if tokens < 50 or tokens > 2000:
+            raise ArgumentError("Max tokens must be between 50 and 2000.")
+        return "ai_max_tokens", tokens, f"AI max tokens set to: `{tokens}`"
+
+    if option == "ai_persona":
+        if len(value) > 800:
+            raise ArgumentError("Persona is too long (max 800 characters).")
+        return "ai_persona", value, "AI persona updated."
+
+    if option == "ai_cache":
+        if value.lower() not in ("on", "off"):
+            raise ArgumentError("AI cache must be `on` or `off`.")
+        return "ai_cache", value.lower() == "on", f"AI response cache turned {value.lower()}."
+
+    if option == "ai_memory":
+        if value.lower() not in ("on", "off"):
+            raise ArgumentError("AI memory must be `on` or `off`.")
+        return "ai_memory", value.lower() == "on", f"AI conversation memory turned {value.lower()}."
+
+    if option in ("image_model", "image_provider"):
+        raise ArgumentError("Image generation is fixed to Stability SDXL; no image settings to change.")
+
+    raise ArgumentError(f"Unknown setting. Available options: {', '.join(f'`{o}`' for o in SETTING_OPTIONS)}")
+
+
+def parse_set_args(args, prefix="&"):
+    # "&set <option> <value...>" -> (option, value) or raises ArgumentError
+    parts = (args or "").strip().split(None, 1)
+    if len(parts) < 2:
+        raise ArgumentError(
+            f"Usage: `{prefix}set <option> <value>`\nAvailable options: "
+            + ", ".join(f"`{o}`" for o in SETTING_OPTIONS)
+        )
+    return parts[0], parts[1]
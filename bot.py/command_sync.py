@@ -0,0 +1,93 @@
+import os
+import json
+import asyncio
+import hashlib
+import discord  # type: ignore[reportMissingImports]
+
+# Diff-based slash command sync.
+# The global command set is pushed only when the hash of the local tree
+# differs from the one stored after the last successful sync, and guilds
+# are only touched when they still carry stale guild-specific commands.
+# The local tree never defines guild-scoped commands, so a guild found
+# clean stays clean across global changes. In a sharded deployment only
+# the primary worker pushes the global command set.
+
+SYNC_CONCURRENCY = int(os.getenv("COMMAND_SYNC_CONCURRENCY", "4"))
+
+FINGERPRINT_KEY = "command_fingerprint"
+
+
+def _command_payload(command, tree):
+    # discord.py >= 2.4 takes the tree; older versions take no argument
+    try:
+        return command.to_dict(tree)
+    except TypeError:
+        return command.to_dict()
+
+
+def tree_fingerprint(tree, application_id):
+    commands = sorted(tree.get_commands(), key=lambda c: c.name)
+    raw = json.dumps(
+        [application_id, [_command_payload(c, tree) for c in commands]],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class CommandSync:
+    def __init__(self, tree, store, concurrency=SYNC_CONCURRENCY, primary=True):
+        self.tree = tree
+        self.store = store
+        self.primary = primary
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._started = False
+        self._cleanup = None
+
+    async def sync_global(self, application_id):
+        fingerprint = tree_fingerprint(self.tree, application_id)
+        if self.store.meta.get(FINGERPRINT_KEY) == fingerprint:
+            print("Slash commands unchanged; skipping global sync.")
+            return False
+        synced = await self.tree.sync()
+        self.store.set_meta(FINGERPRINT_KEY, fingerprint)
+        print(f"Slash commands globally synced: {len(synced)} commands.")
+        return True
+
+    async def clean_guild(self, guild_id):
+        # Drop leftover guild-specific commands so only the global ones remain
+        async with self._semaphore:
+            gobj = discord.Object(id=guild_id)
+            try:
+                existing = await self.tree.fetch_commands(guild=gobj)
+                if existing:
+                    # The local tree has no guild commands, so one sync clears them all
+                    await self.tree.sync(guild=gobj)
+                self.store.mark_guild_clean(guild_id)
+                return bool(existing)
+            except Exception as e:
+                print(f"Failed to clean commands in guild {guild_id}: {e}")
+                return None
+
+    async def _clean_guilds_task(self, guild_ids):
+        results = await asyncio.gather(*(self.clean_guild(g) for g in guild_ids))
+        cleaned = results.count(True)
+        failed = results.count(None)
+        print(f"Guild command cleanup done: {cleaned} cleaned, {len(results) - cleaned - failed} already clean, {failed} failed.")
+
+    async def run(self, client):
+        # Runs once per process; reconnects fire on_ready again but skip this
+        if self._started:
+            return
+        self._started = True
+        if self.primary:
+            try:
+                await self.sync_global(client.application_id)
+            except Exception:
+                # Let the next on_ready try again
+                self._started = False
+                raise
+        clean = self.store.clean_guilds
+        pending = [g.id for g in client.guilds if g.id not in clean]
+        if pending:
+            self._cleanup = asyncio.ensure_future(self._clean_guilds_task(pending))
@@ -0,0 +1,123 @@
+import os
+import re
+import time
+from collections import OrderedDict, deque, namedtuple
+
+# Per-channel conversation memory for &ask and /ask.
+# Each channel keeps a small ring buffer of recent (question, answer)
+# turns, and the channels themselves are LRU-capped and expire when idle.
+# When a prompt is built, the newest turns that fit the token budget are
+# sent verbatim and the older ones are summarized for that prompt only.
+# Building a prompt never changes the memory: turns are folded into the
+# stored extractive summary only when record() pushes them out of the ring
+# buffer, so request size stays flat as a conversation grows.
+
+MEMORY_TURNS = int(os.getenv("AI_MEMORY_TURNS", "8"))
+MEMORY_CHANNELS = int(os.getenv("AI_MEMORY_CHANNELS", "5000"))
+MEMORY_TTL = float(os.getenv("AI_MEMORY_TTL", "3600"))  # seconds a quiet channel is remembered
+SUMMARY_TOKENS = int(os.getenv("AI_MEMORY_SUMMARY_TOKENS", "150"))
+TURN_CHARS = 1000  # stored length of a single question or answer
+
+Context = namedtuple("Context", ["summary", "turns"])
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def estimate_tokens(text):
+    # Rough Gemini token count (about 4 characters per token); no tokenizer needed
+    return len(text) // 4 + 1
+
+
+def _first_sentence(text, limit):
+    text = " ".join(text.split())
+    match = _SENTENCE_END.search(text)
+    if match and match.start() < limit:
+        return text[:match.start()]
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + "..."
+
+
+def _keep_tail(text, tokens):
+    # Drop the oldest summary entries until the rest fits
+    limit = tokens * 4
+    if len(text) <= limit:
+        return text
+    cut = text.find("; ", len(text) - limit)
+    return text[cut + 2:] if cut >= 0 else ""
+
+
+class ChannelMemory:
+    __slots__ = ("turns", "summary", "updated")
+
+    def __init__(self, max_turns):
+        self.turns = deque(maxlen=max_turns)
+        self.summary = ""
+        self.updated = time.monotonic()
+
+
+class ConversationStore:
+    def __init__(self, max_turns=MEMORY_TURNS, max_channels=MEMORY_CHANNELS, ttl=MEMORY_TTL, summary_tokens=SUMMARY_TOKENS):
+        self.max_turns = max(1, max_turns)
+        self.max_channels = max_channels
+        self.ttl = ttl
+        self.summary_tokens = summary_tokens
+        self._channels = OrderedDict()  # channel id -> ChannelMemory, LRU order
+        self.folded = 0
+
+    def __len__(self):
+        return len(self._channels)
+
+    def _get(self, channel_id):
+        memory = self._channels.get(channel_id)
+        if memory is None:
+            return None
+        if self.ttl and time.monotonic() - memory.updated > self.ttl:
+            del self._channels[channel_id]
+            return None
+        self._channels.move_to_end(channel_id)
+        return memory
+
+    def _summarize(self, summary, turn):
+        # summary with one more turn appended, trimmed to the summary budget
+        question, answer = turn
+        entry = f"Q: {_first_sentence(question, 120)} A: {_first_sentence(answer, 160)}"
+        summary = f"{summary}; {entry}" if summary else entry
+        return _keep_tail(summary, self.summary_tokens)
+
+    def context(self, channel_id, prompt, budget_tokens):
+        # Context(summary, turns) for the next prompt, or None without history
+        memory = self._get(channel_id)
+        if memory is None or not (memory.turns or memory.summary):
+            return None
+        remaining = budget_tokens - estimate_tokens(prompt)
+        kept = 0
+        for question, answer in reversed(memory.turns):
+            cost = estimate_tokens(question) + estimate_tokens(answer)
+            if cost > remaining:
+                break
+            remaining -= cost
+            kept += 1
+        turns = list(memory.turns)
+        # Turns that no longer fit go into this prompt's summary; the stored ones stay as they are
+        summary = memory.summary
+        for turn in turns[:len(turns) - kept]:
+            summary = self._summarize(summary, turn)
+        summary = _keep_tail(summary, remaining) if remaining > 0 else ""
+        if not kept and not summary:
+            return None
+        return Context(summary, turns[len(turns) - kept:])
+
+    def record(self, channel_id, question, answer):
+        memory = self._get(channel_id)
+        if memory is None:
+            memory = self._channels[channel_id] = ChannelMemory(self.max_turns)
+            if len(self._channels) > self.max_channels:
+                self._channels.popitem(last=False)
+        if len(memory.turns) == memory.turns.maxlen:
+            # The oldest turn is about to drop out of the ring buffer
+            memory.summary = self._summarize(memory.summary, memory.turns[0])
+            self.folded += 1
+        memory.turns.append((question[:TURN_CHARS], answer[:TURN_CHARS]))
+        memory.updated = time.monotonic()
+
+    def forget(self, channel_id):
+        return self._channels.pop(channel_id, None) is not None
@@ -0,0 +1,93 @@
+import os
+import asyncio
+import json
+import aiohttp  # type: ignore[reportMissingImports]
+
+# Shared async HTTP layer for the Gemini and Stability calls.
+# One ClientSession per process keeps connections alive per upstream host,
+# so AI requests never block the event loop and reuse TLS connections.
+
+MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+MAX_PER_HOST = int(os.getenv("HTTP_MAX_PER_HOST", "20"))
+KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "30"))
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "60"))
+STABILITY_TIMEOUT = float(os.getenv("STABILITY_TIMEOUT", "90"))
+
+_session = None
+
+
+async def start():
+    # Create the shared session; safe to call more than once
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=MAX_CONNECTIONS,
+            limit_per_host=MAX_PER_HOST,
+            keepalive_timeout=KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=300,
+        )
+        _session = aiohttp.ClientSession(connector=connector)
+    return _session
+
+
+async def close():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+        # Give the connector a moment to close the underlying transports
+        await asyncio.sleep(0.25)
+    _session = None
+
+
+async def get_session():
+    if _session is None or _session.closed:
+        return await start()
+    return _session
+
+
+def _timeout(total):
+    return aiohttp.ClientTimeout(total=total, sock_connect=CONNECT_TIMEOUT)
+
+
+def retry_after(resp):
+    # Seconds from a Retry-After header, or None when absent or not numeric
+    value = resp.headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+async def post_json(url, headers, payload, timeout):
+    # Returns (status, body, retry_after) where body is the decoded JSON on
+    # success and the raw response text otherwise.
+    session = await get_session()
+    async with session.post(url, headers=headers, json=payload, timeout=_timeout(timeout)) as resp:
+        if resp.status != 200:
+            return resp.status, await resp.text(), retry_after(resp)
+        return resp.status, await resp.json(content_type=None), None
+
+
+class UpstreamError(Exception):
+    def __init__(self, status, text, retry_after=None):
+        super().__init__(f"{status} {text}")
+        self.status = status
+        self.text = text
+        self.retry_after = retry_after
+
+
+async def stream_sse(url, headers, payload, timeout):
+    # Yields each decoded JSON event of a server-sent-events response.
+    # Raises UpstreamError if the upstream answers with a non-200 status.
+    session = await get_session()
+    async with session.post(url, headers=headers, json=payload, timeout=_timeout(timeout)) as resp:
+        if resp.status != 200:
+            raise UpstreamError(resp.status, await resp.text(), retry_after(resp))
+        async for raw in resp.content:
+            line = raw.decode("utf-8").strip()
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data:
+                yield json.loads(data)
@@ -0,0 +1,293 @@
+import os
+import io
+import stat
+import asyncio
+import base64
+import hashlib
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from shards import WORKER_COUNT, WORKER_NAME
+
+try:
+    from PIL import Image  # type: ignore[reportMissingImports]
+except ImportError:  # Re-encoding and previews need Pillow; without it PNGs pass through
+    Image = None
+
+# Image post-processing off the event loop, plus a content-addressed disk
+# cache so repeat prompts are served locally instead of from Stability.
+# Sharded workers each get their own subdirectory and an even share of
+# IMAGE_CACHE_MB, so the total stays within the configured size.
+
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "webp").lower()  # png, webp or jpeg
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+IMAGE_PREVIEW_SIZE = int(os.getenv("IMAGE_PREVIEW_SIZE", "256"))  # 0 disables previews
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "image_cache")  # empty disables the cache
+IMAGE_CACHE_MB = float(os.getenv("IMAGE_CACHE_MB", "512"))
+IMAGE_GRID_TILE = int(os.getenv("IMAGE_GRID_TILE", "512"))  # tile size in the variant grid
+
+_EXTENSIONS = {"png": "png", "webp": "webp", "jpeg": "jpg"}
+
+RenderedImage = namedtuple("RenderedImage", ["data", "filename", "preview", "preview_filename"])
+# image is what gets uploaded: the single result, or a grid of all variants
+# (None when there are several variants but no Pillow to compose them).
+# key is the ImageCache key the batch is stored under, once it has been.
+ImageBatch = namedtuple("ImageBatch", ["image", "variants", "key"], defaults=(None,))
+
+_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image")
+
+
+def _encode(img, fmt, quality):
+    out = io.BytesIO()
+    if fmt == "jpeg" and img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    if fmt == "png":
+        img.save(out, format="PNG", optimize=True)
+    else:
+        img.save(out, format=fmt.upper(), quality=quality)
+    return out.getvalue()
+
+
+def _process(b64, fmt, quality, preview_size, name="image", keep_image=False):
+    # Returns (RenderedImage, decoded PIL image or None)
+    raw = base64.b64decode(b64)
+    if Image is None or (fmt == "png" and not preview_size and not keep_image):
+        return RenderedImage(raw, f"{name}.png", None, None), None
+    ext = _EXTENSIONS.get(fmt, "png")
+    img = Image.open(io.BytesIO(raw))
+    img.load()
+    data = raw if fmt == "png" else _encode(img, fmt, quality)
+    preview = None
+    if preview_size:
+        thumb = img.copy()
+        thumb.thumbnail((preview_size, preview_size))
+        preview = _encode(thumb, fmt, quality)
+    return RenderedImage(data, f"{name}.{ext}", preview, f"preview.{ext}" if preview else None), img
+
+
+def _compose_grid(images, tile, fmt, quality):
+    cols = 1 if len(images) == 1 else 2
+    rows = (len(images) + cols - 1) // cols
+    grid = Image.new("RGB", (cols * tile, rows * tile))
+    for i, img in enumerate(images):
+        thumb = img.convert("RGB")
+        thumb.thumbnail((tile, tile))
+        grid.paste(thumb, ((i % cols) * tile, (i // cols) * tile))
+    ext = _EXTENSIONS.get(fmt, "png")
+    return RenderedImage(_encode(grid, fmt, quality), f"grid.{ext}", None, None)
+
+
+def process_image(b64, fmt=IMAGE_FORMAT, quality=IMAGE_QUALITY, preview_size=IMAGE_PREVIEW_SIZE):
+    # Runs in a worker thread: decode, optionally re-encode, make a preview
+    return _process(b64, fmt, quality, preview_size)[0]
+
+
+def process_batch(b64_list, fmt=IMAGE_FORMAT, quality=IMAGE_QUALITY, preview_size=IMAGE_PREVIEW_SIZE, tile=IMAGE_GRID_TILE):
+    # Runs in a worker thread: every variant, plus one grid when there are several
+    if len(b64_list) == 1:
+        rendered = process_image(b64_list[0], fmt, quality, preview_size)
+        return ImageBatch(rendered, [rendered])
+    processed = [
+        _process(b64, fmt, quality, preview_size, name=f"variant-{i + 1}", keep_image=True)
+        for i, b64 in enumerate(b64_list)
+    ]
+    variants = [rendered for rendered, _ in processed]
+    grid = None
+    if Image is not None:
+        grid = _compose_grid([img for _, img in processed], tile, fmt, quality)
+    return ImageBatch(grid, variants)
+
+
+async def render(b64):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, process_image, b64)
+
+
+async def render_batch(b64_list):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, process_batch, b64_list)
+
+
+def cache_key(request_key):
+    # Output settings are part of the key so changing them misses cleanly
+    raw = f"{request_key}|{IMAGE_FORMAT}|{IMAGE_QUALITY}|{IMAGE_PREVIEW_SIZE}|{Image is not None}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _worker_directory(directory):
+    return os.path.join(directory, WORKER_NAME) if directory and WORKER_NAME else directory
+
+
+class ImageCache:
+    def __init__(self, directory=_worker_directory(IMAGE_CACHE_DIR), max_bytes=int(IMAGE_CACHE_MB * 1024 * 1024 / WORKER_COUNT)):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._index = None  # key -> (filename, preview filename or None, size), LRU order
+        self._bytes = 0
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return bool(self.directory) and self.max_bytes > 0
+
+    def _scan(self):
+        # Rebuild the index from disk, oldest first
+        os.makedirs(self.directory, exist_ok=True)
+        entries = {}
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            key, _, rest = name.partition(".")
+            try:
+                info = os.stat(path)
+            except OSError:
+                continue
+            if not stat.S_ISREG(info.st_mode):
+                continue  # worker subdirectories left by an earlier sharded run
+            entry = entries.setdefault(key, {"main": None, "preview": None, "size": 0, "mtime": 0})
+            entry["preview" if rest.startswith("preview.") else "main"] = name
+            entry["size"] += info.st_size
+            entry["mtime"] = max(entry["mtime"], info.st_mtime)
+        index = OrderedDict()
+        for key, entry in sorted(entries.items(), key=lambda kv: kv[1]["mtime"]):
+            if entry["main"]:
+                index[key] = (entry["main"], entry["preview"], entry["size"])
+        return index
+
+    async def _ensure_index(self):
+        if self._index is None:
+            self._index = await asyncio.to_thread(self._scan)
+            self._bytes = sum(size for _, _, size in self._index.values())
+
+    def _read(self, main, preview):
+        main_path = os.path.join(self.directory, main)
+        with open(main_path, "rb") as f:
+            data = f.read()
+        preview_data = None
+        if preview:
+            with open(os.path.join(self.directory, preview), "rb") as f:
+                preview_data = f.read()
+        os.utime(main_path)  # keeps LRU order across restarts
+        return data, preview_data
+
+    def _write(self, key, rendered):
+        main = f"{key}.{rendered.filename.rsplit('.', 1)[-1]}"
+        with open(os.path.join(self.directory, main), "wb") as f:
+            f.write(rendered.data)
+        preview = None
+        if rendered.preview:
+            preview = f"{key}.preview.{rendered.preview_filename.rsplit('.', 1)[-1]}"
+            with open(os.path.join(self.directory, preview), "wb") as f:
+                f.write(rendered.preview)
+        return main, preview
+
+    def _delete(self, names):
+        for name in names:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    async def get(self, key, count=True):
+        # count=False reads without touching hits/misses, for the files of a
+        # batch lookup (counted once in get_batch) and variant button clicks
+        if not self.enabled:
+            return None
+        image = await self._lookup(key)
+        if count:
+            self._count(image is not None)
+        return image
+
+    def _count(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    async def _lookup(self, key):
+        await self._ensure_index()
+        entry = self._index.get(key)
+        if entry is None:
+            return None
+        main, preview, _ = entry
+        try:
+            data, preview_data = await asyncio.to_thread(self._read, main, preview)
+        except OSError:
+            self._forget(key)
+            return None
+        self._index.move_to_end(key)
+        ext = main.rsplit(".", 1)[-1]
+        return RenderedImage(data, f"image.{ext}", preview_data, f"preview.{ext}" if preview_data else None)
+
+    def _forget(self, key):
+        entry = self._index.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+        return entry
+
+    async def put(self, key, rendered):
+        if not self.enabled:
+            return
+        async with self._lock:
+            await self._ensure_index()
+            main, preview = await asyncio.to_thread(self._write, key, rendered)
+            self._forget(key)
+            size = len(rendered.data) + len(rendered.preview or b"")
+            self._index[key] = (main, preview, size)
+            self._bytes += size
+            # Evict least recently used images until we fit again
+            doomed = []
+            while self._bytes > self.max_bytes and len(self._index) > 1:
+                old_key = next(iter(self._index))
+                old_main, old_preview, _ = self._forget(old_key)
+                doomed.extend(n for n in (old_main, old_preview) if n)
+            if doomed:
+                await asyncio.to_thread(self._delete, doomed)
+
+    async def get_batch(self, key, count):
+        # One hit or miss per request, however many files it takes to answer it
+        if not self.enabled:
+            return None
+        batch = await self._lookup_batch(key, count)
+        self._count(batch is not None)
+        return batch
+
+    async def _lookup_batch(self, key, count):
+        # A batch is only a hit when the uploaded image and every variant are cached
+        if count == 1:
+            image = await self.get(key, count=False)
+            return ImageBatch(image, [image]) if image is not None else None
+        variants = []
+        for i in range(count):
+            variant = await self.get(f"{key}-{i + 1}", count=False)
+            if variant is None:
+                return None
+            variants.append(variant._replace(filename=f"variant-{i + 1}.{variant.filename.rsplit('.', 1)[-1]}"))
+        image = await self.get(key, count=False)
+        if image is not None:
+            image = image._replace(filename=f"grid.{image.filename.rsplit('.', 1)[-1]}")
+        elif Image is not None:
+            return None
+        return ImageBatch(image, variants)
+
+    async def put_batch(self, key, batch):
+        if len(batch.variants) == 1:
+            await self.put(key, batch.variants[0])
+            return
+        for i, variant in enumerate(batch.variants):
+            await self.put(f"{key}-{i + 1}", variant)
+        if batch.image is not None:
+            await self.put(key, batch.image)
+
+    def stats(self):
+        return {
+            "entries": len(self._index or ()),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def shutdown():
+    _executor.shutdown(wait=False)
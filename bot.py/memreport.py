@@ -0,0 +1,109 @@
+import os
+import sys
+import tracemalloc
+import discord  # type: ignore[reportMissingImports]
+
+# Memory profile for the gateway connection and on-demand allocation
+# reports. The "low" profile only asks for the intents the commands use
+# and keeps the member and message caches small; "full" restores the old
+# Intents.all() behaviour.
+
+MEMORY_PROFILE = os.getenv("MEMORY_PROFILE", "low").lower()
+TRACEMALLOC_FRAMES = int(os.getenv("TRACEMALLOC_FRAMES", "1"))
+
+
+def build_intents(profile=MEMORY_PROFILE):
+    if profile == "full":
+        return discord.Intents.all()
+    intents = discord.Intents.none()
+    intents.guilds = True  # guild and channel cache, slash command routing
+    intents.guild_messages = True  # prefix commands
+    intents.message_content = True  # reading prefix command text
+    intents.members = True  # on_member_join
+    return intents
+
+
+def client_options(profile=MEMORY_PROFILE):
+    low = profile != "full"
+    intents = build_intents(profile)
+    member_cache = os.getenv("MEMBER_CACHE", "none" if low else "all").lower()
+    if member_cache == "none":
+        member_cache_flags = discord.MemberCacheFlags.none()
+    elif member_cache == "joined":
+        member_cache_flags = discord.MemberCacheFlags.none()
+        member_cache_flags.joined = True
+    elif member_cache == "all":
+        # Everything the intents allow; voice caching needs voice_states, which "low" leaves off
+        member_cache_flags = discord.MemberCacheFlags.from_intents(intents)
+    else:
+        raise ValueError(f"MEMBER_CACHE must be none, joined or all, not {member_cache!r}")
+    message_cache = int(os.getenv("MESSAGE_CACHE_SIZE", "0" if low else "1000"))
+    return {
+        "intents": intents,
+        "member_cache_flags": member_cache_flags,
+        "max_messages": message_cache or None,
+        "chunk_guilds_at_startup": not low and member_cache != "none",
+    }
+
+
+def rss_bytes():
+    # Current resident set size; falls back to the peak where /proc is missing
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        return None
+
+
+def start_tracing(frames=TRACEMALLOC_FRAMES):
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+        return True
+    return False
+
+
+def stop_tracing():
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+        return True
+    return False
+
+
+def _mib(n):
+    return f"{n / (1024 * 1024):.1f} MiB"
+
+
+def summary(client):
+    # Cheap numbers read from the client cache; call on the event loop
+    lines = [f"Profile: {MEMORY_PROFILE}"]
+    guilds = len(client.guilds)
+    rss = rss_bytes()
+    if rss is not None:
+        per_guild = f", {_mib(rss / guilds)} per guild" if guilds else ""
+        lines.append(f"RSS: {_mib(rss)} across {guilds} guilds{per_guild}")
+    members = sum(len(g.members) for g in client.guilds)
+    lines.append(f"Cached members: {members}, cached messages: {len(client.cached_messages)}")
+    return "\n".join(lines)
+
+
+def top_allocations(limit=10):
+    # Takes a tracemalloc snapshot; slow on big heaps, so run it in a thread
+    if not tracemalloc.is_tracing():
+        return "Allocation tracing is off (start it with `memory start`)."
+    current, peak = tracemalloc.get_traced_memory()
+    lines = [f"Traced: {_mib(current)} now, {_mib(peak)} peak"]
+    stats = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    )).statistics("lineno")
+    lines.append(f"Top {limit} allocation sites:")
+    for stat in stats[:limit]:
+        frame = stat.traceback[0]
+        lines.append(f"{_mib(stat.size):>10}  {stat.count:>7} blocks  {frame.filename}:{frame.lineno}")
+    return "\n".join(lines)
@@ -0,0 +1,191 @@
+import os
+import time
+import asyncio
+from bisect import bisect_left
+from contextlib import contextmanager
+from aiohttp import web  # type: ignore[reportMissingImports]
+
+# In-process metrics in Prometheus text format.
+# Recording is a perf_counter() call, a bisect and a few dict updates,
+# so it stays on under load. The /metrics endpoint is only served when
+# METRICS_PORT is set.
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # 0 disables the endpoint
+LOOP_LAG_INTERVAL = float(os.getenv("METRICS_LOOP_LAG_INTERVAL", "0.5"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=(), fn=None):
+        # fn() -> {label values tuple: value} is read at scrape time, for
+        # totals another component already keeps
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.fn = fn
+        _registry.append(self)
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        values = self.fn() if self.fn is not None else self.values
+        for labels, value in values.items():
+            yield self.name, _format_labels(self.labels, labels), value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, *labels):
+        self.values[labels] = value
+
+    def dec(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = {}  # labels -> [bucket counts..., +Inf count, sum]
+        _registry.append(self)
+
+    def observe(self, value, *labels):
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = [0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def samples(self):
+        names = self.labels + ("le",)
+        for labels, series in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                yield f"{self.name}_bucket", _format_labels(names, labels + (bound,)), cumulative
+            yield f"{self.name}_count", _format_labels(self.labels, labels), cumulative
+            yield f"{self.name}_sum", _format_labels(self.labels, labels), series[-1]
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{labels} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# Hot-path metrics shared by the bot modules
+handler_seconds = Histogram("bot_handler_seconds", "Time spent in event handlers and commands", ("kind", "name"))
+handler_errors = Counter("bot_handler_errors_total", "Event handlers and commands that raised", ("kind", "name"))
+in_flight = Gauge("bot_in_flight", "Handlers and upstream calls currently running", ("kind",))
+upstream_seconds = Histogram("bot_upstream_seconds", "Time spent waiting on Gemini and Stability", ("api",))
+upstream_errors = Counter("bot_upstream_errors_total", "Upstream responses that were not 200, by status code", ("api", "status"))
+queue_wait_seconds = Histogram("bot_queue_wait_seconds", "Time spent waiting for an admission slot", ("pool",))
+discord_send_seconds = Histogram("bot_discord_send_seconds", "Time spent sending or editing Discord messages", ("kind",))
+loop_lag_seconds = Histogram(
+    "bot_event_loop_lag_seconds",
+    "How late the event loop woke a sleeping task",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+
+@contextmanager
+def track(kind, name):
+    # Latency, errors and in-flight count for one handler invocation
+    key = (kind,)
+    in_flight.values[key] = in_flight.values.get(key, 0) + 1
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        handler_errors.inc(kind, name)
+        raise
+    finally:
+        handler_seconds.observe(time.perf_counter() - start, kind, name)
+        in_flight.values[key] -= 1
+
+
+@contextmanager
+def upstream(api):
+    key = ("upstream_" + api,)
+    in_flight.values[key] = in_flight.values.get(key, 0) + 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        upstream_seconds.observe(time.perf_counter() - start, api)
+        in_flight.values[key] -= 1
+
+
+async def monitor_loop_lag(interval=LOOP_LAG_INTERVAL):
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        loop_lag_seconds.observe(max(0.0, time.perf_counter() - start - interval))
+
+
+class MetricsServer:
+    def __init__(self, host=METRICS_HOST, port=METRICS_PORT):
+        self.host = host
+        self.port = port
+        self._runner = None
+        self._lag_task = None
+
+    async def start(self):
+        self._lag_task = asyncio.ensure_future(monitor_loop_lag())
+        if not self.port:
+            return
+        async def handle(request):
+            return web.Response(
+                body=render().encode("utf-8"),
+                headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+            )
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        print(f"Metrics served on http://{self.host}:{self.port}/metrics")
+
+    async def close(self):
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            self._lag_task = None
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,92 @@
+import os
+import time
+import asyncio
+import discord  # type: ignore[reportMissingImports]
+
+# Event-driven presence: the bot goes "active" when a command is used and
+# back to "idle" after a quiet period. A gateway presence update is sent
+# only on a real idle <-> active change, and the idle timeout is a single
+# timer that is re-armed lazily instead of a once-per-second poll.
+
+IDLE_TIMEOUT = float(os.getenv("PRESENCE_IDLE_TIMEOUT", "120"))
+
+IDLE = "idle"
+ACTIVE = "active"
+
+
+def _presence_kwargs(state):
+    if state == ACTIVE:
+        return {
+            "status": discord.Status.online,
+            "activity": discord.Activity(type=discord.ActivityType.listening, name="help"),
+        }
+    return {
+        "status": discord.Status.idle,
+        "activity": discord.Activity(type=discord.ActivityType.playing, name="Dynamically"),
+    }
+
+
+class PresenceManager:
+    def __init__(self, client, idle_timeout=IDLE_TIMEOUT):
+        self.client = client
+        self.idle_timeout = idle_timeout
+        self.state = IDLE
+        self._sent = None
+        self._deadline = 0.0
+        self._timer = None
+        self._sync_task = None
+        self._started_at = None
+        self.updates_sent = 0
+
+    @property
+    def polls_replaced(self):
+        # Updates the old 1-second polling loop would have sent by now; the
+        # savings are polls_replaced - updates_sent, left to the query
+        if self._started_at is None:
+            return 0
+        return int(time.monotonic() - self._started_at)
+
+    def start(self):
+        # Called from on_ready; a new gateway session needs the presence again
+        if self._started_at is None:
+            self._started_at = time.monotonic()
+        self._sent = None
+        self._request_sync()
+
+    def touch(self):
+        # A command was used (slash or prefix)
+        self._deadline = time.monotonic() + self.idle_timeout
+        if self.state != ACTIVE:
+            self.state = ACTIVE
+            self._request_sync()
+        if self._timer is None:
+            self._arm(self.idle_timeout)
+
+    def _arm(self, delay):
+        self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        remaining = self._deadline - time.monotonic()
+        if remaining > 0:
+            # Commands arrived since the timer was armed; wait for the rest
+            self._arm(remaining)
+            return
+        self.state = IDLE
+        self._request_sync()
+
+    def _request_sync(self):
+        if self._sync_task is None or self._sync_task.done():
+            self._sync_task = asyncio.ensure_future(self._sync())
+
+    async def _sync(self):
+        # Keep going until the last state sent matches the wanted state
+        while self._sent != self.state:
+            state = self.state
+            try:
+                await self.client.change_presence(**_presence_kwargs(state))
+            except Exception as e:
+                print(f"Failed to update presence: {e}")
+                return
+            self._sent = state
+            self.updates_sent += 1
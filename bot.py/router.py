@@ -0,0 +1,45 @@
+# Table-driven dispatch for prefix commands.
+# Each message costs one prefix lookup for its guild and one dict lookup
+# for the command name, and resolves to at most one handler.
+
+
+class CommandRouter:
+    def __init__(self, default_prefix):
+        self.default_prefix = default_prefix
+        self._prefixes = {}  # guild id -> custom prefix
+        self._commands = {}
+
+    def command(self, name, *aliases):
+        def decorator(handler):
+            for key in (name, *aliases):
+                if key in self._commands:
+                    raise ValueError(f"Command {key!r} is already registered")
+                self._commands[key] = handler
+            return handler
+        return decorator
+
+    @property
+    def names(self):
+        return list(self._commands)
+
+    def set_prefix(self, guild_id, prefix):
+        if prefix and prefix != self.default_prefix:
+            self._prefixes[guild_id] = prefix
+        else:
+            self._prefixes.pop(guild_id, None)
+
+    def prefix(self, guild_id):
+        return self._prefixes.get(guild_id, self.default_prefix)
+
+    def resolve(self, content, guild_id=None):
+        # Returns (handler, name, args) or None when no command matches
+        prefix = self._prefixes.get(guild_id, self.default_prefix)
+        if not content.startswith(prefix):
+            return None
+        parts = content[len(prefix):].split(None, 1)
+        if not parts:
+            return None
+        handler = self._commands.get(parts[0])
+        if handler is None:
+            return None
+        return handler, parts[0], parts[1] if len(parts) > 1 else ""
@@ -0,0 +1,212 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+import metrics
+from shards import WORKER_COUNT
+
+# Admission control between the command handlers and the upstream APIs.
+# Each pool (text, image) has token buckets per user, per guild and
+# globally, a concurrency cap and a bounded wait queue that is served
+# round-robin across guilds. A full queue or an empty user/guild bucket
+# rejects right away instead of piling up work.
+# With several sharded worker processes the bot-wide rate is split evenly
+# between them. Concurrency and the per-guild and per-user limits stay per
+# process: per-guild limits stay exact because only one worker serves a
+# guild, while a user active in guilds on several workers gets each
+# worker's allowance.
+
+BUSY_MESSAGE = "I'm a bit busy right now, try again in a few seconds."
+RATE_LIMITED_MESSAGE = "Slow down a little, try again in a few seconds."
+
+MAX_TRACKED_BUCKETS = 10000
+
+
+class PoolBusy(Exception):
+    def __init__(self, message=BUSY_MESSAGE):
+        super().__init__(message)
+
+
+class TokenBucket:
+    def __init__(self, per_minute, capacity):
+        self.rate = per_minute / 60.0
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        # Seconds until a token is available (0 when one is available now)
+        now = time.monotonic()
+        self._refill(now)
+        if self.tokens >= 1 or self.rate <= 0:
+            return 0.0 if self.tokens >= 1 else float("inf")
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        if self.wait_time() > 0:
+            return False
+        self.tokens -= 1
+        return True
+
+
+def _burst(per_minute):
+    return max(1, per_minute // 4)
+
+
+class WorkPool:
+    def __init__(self, name, concurrency, queue_size, global_per_min, guild_per_min, user_per_min):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.guild_queue_size = max(1, queue_size // 4)
+        self.guild_per_min = guild_per_min
+        self.user_per_min = user_per_min
+        self._global = TokenBucket(global_per_min, max(1, concurrency))
+        self._guild_buckets = OrderedDict()
+        self._user_buckets = OrderedDict()
+        self._queues = OrderedDict()  # guild id -> deque of waiting futures
+        self._queued = 0
+        self._active = 0
+        self._paused_until = 0.0
+        self._wakeup = None
+        self.admitted = 0
+        self.rejected = 0
+
+    @property
+    def active(self):
+        return self._active
+
+    @property
+    def queued(self):
+        return self._queued
+
+    def _bucket(self, table, key, per_minute):
+        bucket = table.get(key)
+        if bucket is None:
+            bucket = table[key] = TokenBucket(per_minute, _burst(per_minute))
+            if len(table) > MAX_TRACKED_BUCKETS:
+                table.popitem(last=False)
+        else:
+            table.move_to_end(key)
+        return bucket
+
+    def _check_rates(self, guild_id, user_id):
+        # Returns the buckets to charge once the request is admitted; nothing is spent here
+        buckets = []
+        if guild_id is not None:
+            buckets.append(self._bucket(self._guild_buckets, guild_id, self.guild_per_min))
+        if user_id is not None:
+            buckets.append(self._bucket(self._user_buckets, user_id, self.user_per_min))
+        if any(bucket.wait_time() > 0 for bucket in buckets):
+            self.rejected += 1
+            raise PoolBusy(RATE_LIMITED_MESSAGE)
+        return buckets
+
+    def _blocked_for(self):
+        # Seconds the pool must wait before starting more work
+        return max(self._paused_until - time.monotonic(), self._global.wait_time())
+
+    def backoff(self, seconds):
+        # Honor an upstream Retry-After: start nothing new until it passes
+        if seconds and seconds > 0:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _schedule_dispatch(self, delay):
+        if self._wakeup is None:
+            loop = asyncio.get_running_loop()
+            self._wakeup = loop.call_later(min(delay, 60.0), self._on_wakeup)
+
+    def _on_wakeup(self):
+        self._wakeup = None
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._active < self.concurrency and self._queued:
+            delay = self._blocked_for()
+            if delay > 0:
+                self._schedule_dispatch(delay)
+                return
+            # Round-robin: serve the oldest guild, then move it to the back
+            guild_id, waiters = next(iter(self._queues.items()))
+            fut = waiters.popleft()
+            self._queued -= 1
+            if waiters:
+                self._queues.move_to_end(guild_id)
+            else:
+                del self._queues[guild_id]
+            if fut.done():
+                continue
+            self._global.take()
+            self._active += 1
+            fut.set_result(None)
+
+    def _remove_waiter(self, guild_id, fut):
+        waiters = self._queues.get(guild_id)
+        if waiters is not None and fut in waiters:
+            waiters.remove(fut)
+            self._queued -= 1
+            if not waiters:
+                del self._queues[guild_id]
+
+    @asynccontextmanager
+    async def slot(self, guild_id=None, user_id=None):
+        buckets = self._check_rates(guild_id, user_id)
+        if self._active < self.concurrency and not self._queued and self._blocked_for() <= 0:
+            for bucket in buckets:
+                bucket.take()
+            self._global.take()
+            self._active += 1
+            # Admitted without waiting; recorded so the histogram covers every admission
+            metrics.queue_wait_seconds.observe(0.0, self.name)
+        else:
+            waiters = self._queues.get(guild_id)
+            if self._queued >= self.queue_size or (waiters is not None and len(waiters) >= self.guild_queue_size):
+                self.rejected += 1
+                raise PoolBusy()
+            # Accepted into the queue: charge the user and guild now
+            for bucket in buckets:
+                bucket.take()
+            fut = asyncio.get_running_loop().create_future()
+            self._queues.setdefault(guild_id, deque()).append(fut)
+            self._queued += 1
+            self._dispatch()
+            queued_at = time.perf_counter()
+            try:
+                await fut
+            except asyncio.CancelledError:
+                if fut.done() and not fut.cancelled():
+                    # Granted a slot just as we were cancelled; hand it back
+                    self._active -= 1
+                    self._dispatch()
+                else:
+                    self._remove_waiter(guild_id, fut)
+                raise
+            finally:
+                metrics.queue_wait_seconds.observe(time.perf_counter() - queued_at, self.name)
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self._active -= 1
+            self._dispatch()
+
+
+def _pool_from_env(name, concurrency, queue_size, global_per_min, guild_per_min, user_per_min):
+    prefix = name.upper()
+    return WorkPool(
+        name,
+        concurrency=int(os.getenv(f"{prefix}_CONCURRENCY", str(concurrency))),
+        queue_size=int(os.getenv(f"{prefix}_QUEUE_SIZE", str(queue_size))),
+        global_per_min=float(os.getenv(f"{prefix}_GLOBAL_PER_MIN", str(global_per_min))) / WORKER_COUNT,
+        guild_per_min=float(os.getenv(f"{prefix}_GUILD_PER_MIN", str(guild_per_min))),
+        user_per_min=float(os.getenv(f"{prefix}_USER_PER_MIN", str(user_per_min))),
+    )
+
+
+text_pool = _pool_from_env("text", concurrency=8, queue_size=64, global_per_min=300, guild_per_min=60, user_per_min=12)
+image_pool = _pool_from_env("image", concurrency=2, queue_size=16, global_per_min=30, guild_per_min=10, user_per_min=4)
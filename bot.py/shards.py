@@ -0,0 +1,131 @@
+import os
+import time
+import asyncio
+import discord  # type: ignore[reportMissingImports]
+
+# Sharded runtime. SHARD_MODE picks how the gateway connection is split:
+#   off     one discord.Client (the default)
+#   auto    one AutoShardedClient running every shard in this process
+#   worker  one process owning SHARD_IDS out of SHARD_COUNT; started by
+#           supervisor.py, which runs SHARD_WORKERS of these side by side
+# A guild always lives on exactly one shard, so per-guild state (settings,
+# welcome channels, per-guild rate limits) is owned by a single process and
+# only meets the other workers in the shared SQLite store. Bot-wide upstream
+# limits are split between the workers, and 429 cooldowns are published
+# through the store so every worker backs off together.
+
+SHARD_MODE = os.getenv("SHARD_MODE", "off").lower()
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0"))  # 0 lets Discord recommend one in auto mode
+SHARD_IDS_TEXT = os.getenv("SHARD_IDS", "")
+WORKER_COUNT = max(1, int(os.getenv("SHARD_WORKERS", "1"))) if SHARD_MODE == "worker" else 1
+COOLDOWN_POLL_INTERVAL = float(os.getenv("SHARD_COOLDOWN_POLL_INTERVAL", "1"))
+
+
+def parse_shard_ids(text):
+    # "0-3,8" -> [0, 1, 2, 3, 8]
+    ids = set()
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start, _, end = part.partition("-")
+        ids.update(range(int(start), int(end or start) + 1))
+    return sorted(ids)
+
+
+def format_shard_ids(ids):
+    # [0, 1, 2, 3, 8] -> "0-3,8"
+    ranges = []
+    for shard_id in sorted(ids):
+        if ranges and shard_id == ranges[-1][1] + 1:
+            ranges[-1][1] = shard_id
+        else:
+            ranges.append([shard_id, shard_id])
+    return ",".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+
+SHARD_IDS = parse_shard_ids(SHARD_IDS_TEXT)
+
+if SHARD_MODE not in ("off", "auto", "worker"):
+    raise ValueError(f"SHARD_MODE must be off, auto or worker, not {SHARD_MODE!r}")
+if SHARD_MODE == "worker" and (not SHARD_COUNT or not SHARD_IDS):
+    raise ValueError("SHARD_MODE=worker needs SHARD_COUNT and SHARD_IDS")
+if any(shard_id >= SHARD_COUNT for shard_id in SHARD_IDS):
+    raise ValueError(f"SHARD_IDS {SHARD_IDS_TEXT!r} must be below SHARD_COUNT {SHARD_COUNT}")
+
+BaseClient = discord.Client if SHARD_MODE == "off" else discord.AutoShardedClient
+
+# Bot-wide work (the global slash command sync) is done by one process only
+IS_PRIMARY = SHARD_MODE != "worker" or 0 in SHARD_IDS
+# Names this worker's private on-disk state; stable while SHARD_COUNT and SHARD_WORKERS are
+WORKER_NAME = f"shards-{format_shard_ids(SHARD_IDS)}" if SHARD_MODE == "worker" else ""
+
+
+def client_options():
+    if SHARD_MODE == "off":
+        return {}
+    options = {}
+    if SHARD_COUNT:
+        options["shard_count"] = SHARD_COUNT
+    if SHARD_MODE == "worker":
+        options["shard_ids"] = SHARD_IDS
+    return options
+
+
+def describe():
+    if SHARD_MODE == "off":
+        return "unsharded"
+    if SHARD_MODE == "auto":
+        return f"auto-sharded, {SHARD_COUNT or 'recommended'} shards"
+    return f"shards {format_shard_ids(SHARD_IDS)} of {SHARD_COUNT}, 1 of {WORKER_COUNT} workers"
+
+
+class SharedCooldowns:
+    # Upstream Retry-After pauses, shared with the other worker processes.
+    # Times in the store are wall-clock, since monotonic clocks differ per process.
+
+    def __init__(self, store, pools, poll_interval=COOLDOWN_POLL_INTERVAL, enabled=WORKER_COUNT > 1):
+        self.store = store
+        self.pools = {pool.name: pool for pool in pools}
+        self.poll_interval = poll_interval
+        self.enabled = enabled
+        self._poller = None
+        self._writes = set()
+
+    def publish(self, pool, seconds):
+        if not self.enabled or not seconds or seconds <= 0:
+            return
+        task = asyncio.ensure_future(self._publish(pool.name, time.time() + seconds))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    async def _publish(self, name, until):
+        try:
+            await self.store.publish_cooldown(name, until)
+        except Exception as e:
+            print(f"Failed to share {name} cooldown: {e}")
+
+    def start(self):
+        if self.enabled and self._poller is None:
+            self._poller = asyncio.ensure_future(self._poll_loop())
+
+    async def _poll_loop(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                cooldowns = await self.store.read_cooldowns()
+            except Exception as e:
+                print(f"Failed to read shared cooldowns: {e}")
+                continue
+            now = time.time()
+            for name, until in cooldowns.items():
+                pool = self.pools.get(name)
+                if pool is not None and until > now:
+                    pool.backoff(until - now)
+
+    async def close(self):
+        if self._poller is not None:
+            self._poller.cancel()
+            self._poller = None
+        if self._writes:
+            await asyncio.gather(*self._writes, return_exceptions=True)
@@ -0,0 +1,103 @@
+import asyncio
+
+# Coalesces identical in-flight upstream calls: the first caller for a key
+# starts the work, later callers with the same key await the same result.
+# The entry is dropped as soon as the call finishes, so a failure is shared
+# with the callers that were already waiting but never with later ones.
+
+
+class _StreamFlight:
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self._changed = asyncio.Event()
+
+    def push(self, chunk):
+        self.chunks.append(chunk)
+        self._changed.set()
+
+    def finish(self, error=None):
+        self.done = True
+        self.error = error
+        self._changed.set()
+
+    async def follow(self):
+        # Replays what has arrived so far, then waits for new chunks
+        i = 0
+        while True:
+            while i < len(self.chunks):
+                yield self.chunks[i]
+                i += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            self._changed.clear()
+            await self._changed.wait()
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._streams = {}
+        self._pumps = set()
+        self.started = 0
+        self.joined = 0
+
+    def __contains__(self, key):
+        return key in self._calls or key in self._streams
+
+    def _forget(self, table, key, entry):
+        if table.get(key) is entry:
+            del table[key]
+
+    async def do(self, key, fn):
+        # fn() -> awaitable; every caller with the same key gets its result
+        task = self._calls.get(key)
+        if task is None:
+            self.started += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+
+            def _done(t):
+                self._forget(self._calls, key, t)
+                # Mark the exception as retrieved even if every waiter went away
+                if not t.cancelled():
+                    t.exception()
+
+            task.add_done_callback(_done)
+        else:
+            self.joined += 1
+        # Shield so one impatient caller can't cancel the call for everyone
+        return await asyncio.shield(task)
+
+    async def stream(self, key, agen_fn):
+        # agen_fn() -> async iterator; every caller with the same key sees
+        # the full sequence of chunks, including those sent before it joined
+        flight = self._streams.get(key)
+        if flight is None:
+            self.started += 1
+            flight = _StreamFlight()
+            self._streams[key] = flight
+
+            async def _pump():
+                try:
+                    async for chunk in agen_fn():
+                        flight.push(chunk)
+                    flight.finish()
+                except asyncio.CancelledError as e:
+                    flight.finish(e)
+                    raise
+                except Exception as e:
+                    flight.finish(e)
+                finally:
+                    self._forget(self._streams, key, flight)
+
+            pump = asyncio.ensure_future(_pump())
+            self._pumps.add(pump)
+            pump.add_done_callback(self._pumps.discard)
+        else:
+            self.joined += 1
+        async for chunk in flight.follow():
+            yield chunk
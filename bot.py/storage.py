@@ -0,0 +1,154 @@
+import os
+import json
+import asyncio
+import sqlite3
+
+# Persistent per-guild settings and welcome channels.
+# Everything is bulk-loaded into memory at startup, so the per-message
+# read path never touches disk; changes are marked dirty and written
+# back to SQLite (WAL mode) in batches by a background task.
+# Sharded workers share one database file; each writes only the guilds
+# it owns, plus the upstream cooldowns that all of them read.
+
+DB_PATH = os.getenv("BOT_DB_PATH", "bot.db")
+FLUSH_INTERVAL = float(os.getenv("BOT_DB_FLUSH_INTERVAL", "2"))
+
+
+class SettingsStore:
+    def __init__(self, path=DB_PATH, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.settings = {}  # guild id -> settings dict
+        self.welcome_channels = {}  # guild id -> channel id
+        self.meta = {}  # bot-wide key -> JSON-serializable value
+        self.clean_guilds = set()  # guilds verified to carry no stale guild commands
+        self._dirty_settings = set()
+        self._dirty_welcome = set()
+        self._dirty_meta = set()
+        self._dirty_clean = set()
+        self._db = None
+        self._flusher = None
+        self._lock = asyncio.Lock()
+
+    def _connect(self):
+        # Sharded workers write to the same file; wait for their locks instead of failing
+        db = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("CREATE TABLE IF NOT EXISTS guild_settings (guild_id INTEGER PRIMARY KEY, data TEXT NOT NULL)")
+        db.execute("CREATE TABLE IF NOT EXISTS welcome_channels (guild_id INTEGER PRIMARY KEY, channel_id INTEGER NOT NULL)")
+        db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        db.execute("CREATE TABLE IF NOT EXISTS clean_guilds (guild_id INTEGER PRIMARY KEY)")
+        db.execute("CREATE TABLE IF NOT EXISTS cooldowns (name TEXT PRIMARY KEY, until REAL NOT NULL)")
+        db.commit()
+        return db
+
+    def _load_all(self):
+        self._db = self._connect()
+        settings = {row[0]: json.loads(row[1]) for row in self._db.execute("SELECT guild_id, data FROM guild_settings")}
+        welcome = dict(self._db.execute("SELECT guild_id, channel_id FROM welcome_channels"))
+        meta = {row[0]: json.loads(row[1]) for row in self._db.execute("SELECT key, value FROM meta")}
+        clean = {row[0] for row in self._db.execute("SELECT guild_id FROM clean_guilds")}
+        return settings, welcome, meta, clean
+
+    async def load(self):
+        # Fill the in-memory dicts in place so existing references stay valid
+        settings, welcome, meta, clean = await asyncio.to_thread(self._load_all)
+        self.settings.update(settings)
+        self.welcome_channels.update(welcome)
+        self.meta.update(meta)
+        self.clean_guilds.update(clean)
+
+    def start(self):
+        if self._flusher is None:
+            self._flusher = asyncio.ensure_future(self._flush_loop())
+
+    def mark_settings_dirty(self, guild_id):
+        self._dirty_settings.add(guild_id)
+
+    def set_welcome_channel(self, guild_id, channel_id):
+        if channel_id is None:
+            self.welcome_channels.pop(guild_id, None)
+        else:
+            self.welcome_channels[guild_id] = channel_id
+        self._dirty_welcome.add(guild_id)
+
+    def set_meta(self, key, value):
+        self.meta[key] = value
+        self._dirty_meta.add(key)
+
+    def mark_guild_clean(self, guild_id):
+        if guild_id not in self.clean_guilds:
+            self.clean_guilds.add(guild_id)
+            self._dirty_clean.add(guild_id)
+
+    def _write(self, settings_rows, settings_deletes, welcome_rows, welcome_deletes, meta_rows, clean_rows):
+        with self._db:
+            self._db.executemany("INSERT OR REPLACE INTO guild_settings (guild_id, data) VALUES (?, ?)", settings_rows)
+            self._db.executemany("DELETE FROM guild_settings WHERE guild_id = ?", settings_deletes)
+            self._db.executemany("INSERT OR REPLACE INTO welcome_channels (guild_id, channel_id) VALUES (?, ?)", welcome_rows)
+            self._db.executemany("DELETE FROM welcome_channels WHERE guild_id = ?", welcome_deletes)
+            self._db.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", meta_rows)
+            self._db.executemany("INSERT OR IGNORE INTO clean_guilds (guild_id) VALUES (?)", clean_rows)
+
+    async def flush(self):
+        if self._db is None or not (self._dirty_settings or self._dirty_welcome or self._dirty_meta or self._dirty_clean):
+            return
+        async with self._lock:
+            # Snapshot on the loop, write in a worker thread
+            dirty_settings, self._dirty_settings = self._dirty_settings, set()
+            dirty_welcome, self._dirty_welcome = self._dirty_welcome, set()
+            dirty_meta, self._dirty_meta = self._dirty_meta, set()
+            dirty_clean, self._dirty_clean = self._dirty_clean, set()
+            settings_rows = [(g, json.dumps(self.settings[g])) for g in dirty_settings if g in self.settings]
+            settings_deletes = [(g,) for g in dirty_settings if g not in self.settings]
+            welcome_rows = [(g, self.welcome_channels[g]) for g in dirty_welcome if g in self.welcome_channels]
+            welcome_deletes = [(g,) for g in dirty_welcome if g not in self.welcome_channels]
+            meta_rows = [(k, json.dumps(self.meta[k])) for k in dirty_meta]
+            clean_rows = [(g,) for g in dirty_clean]
+            try:
+                await asyncio.to_thread(self._write, settings_rows, settings_deletes, welcome_rows, welcome_deletes, meta_rows, clean_rows)
+            except Exception as e:
+                # Keep the changes dirty so the next flush retries them
+                self._dirty_settings |= dirty_settings
+                self._dirty_welcome |= dirty_welcome
+                self._dirty_meta |= dirty_meta
+                self._dirty_clean |= dirty_clean
+                print(f"Failed to save settings: {e}")
+
+    def _publish_cooldown(self, name, until):
+        with self._db:
+            self._db.execute(
+                "INSERT INTO cooldowns (name, until) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET until = MAX(until, excluded.until)",
+                (name, until),
+            )
+
+    async def publish_cooldown(self, name, until):
+        # Written through right away; the other workers poll for it
+        if self._db is None:
+            return
+        async with self._lock:
+            await asyncio.to_thread(self._publish_cooldown, name, until)
+
+    async def read_cooldowns(self):
+        # name -> wall-clock time until which that upstream pool is paused
+        if self._db is None:
+            return {}
+        async with self._lock:
+            rows = await asyncio.to_thread(lambda: self._db.execute("SELECT name, until FROM cooldowns").fetchall())
+        return dict(rows)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def close(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,69 @@
+import os
+import time
+import metrics
+
+# Progressive rendering of streamed AI text into Discord messages.
+# Edits are throttled so a single message stays well under Discord's
+# edit rate limit (5 edits / 5s), and text past the message size limit
+# rolls over into a new message.
+
+EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.2"))
+MESSAGE_LIMIT = 1990
+EMPTY_REPLY = "Sorry, I couldn't generate a response."
+
+
+def _split_point(text, limit):
+    # Prefer breaking on a newline or space near the limit
+    cut = text.rfind("\n", limit - 200, limit)
+    if cut <= 0:
+        cut = text.rfind(" ", limit - 200, limit)
+    return cut if cut > 0 else limit
+
+
+class StreamingReply:
+    def __init__(self, send, send_first=None):
+        # send(content) -> message with .edit(content=...)
+        # send_first(content) -> message; used for the first message only,
+        # e.g. to fill in a deferred interaction response in place.
+        self._send = send
+        self._send_first = send_first or send
+        self._message = None
+        self._sent_any = False
+        self._text = ""
+        self._shown = ""
+        self._last_edit = 0.0
+        self.full_text = ""
+
+    async def _show(self, content):
+        with metrics.discord_send_seconds.time("stream"):
+            if self._message is None:
+                send = self._send if self._sent_any else self._send_first
+                self._message = await send(content)
+                self._sent_any = True
+            else:
+                await self._message.edit(content=content)
+        self._shown = content
+        self._last_edit = time.monotonic()
+
+    async def feed(self, delta):
+        if not delta:
+            return
+        self.full_text += delta
+        self._text += delta
+        # Roll over into a fresh message once the current one is full
+        while len(self._text) > MESSAGE_LIMIT:
+            cut = _split_point(self._text, MESSAGE_LIMIT)
+            head, self._text = self._text[:cut], self._text[cut:].lstrip()
+            if head != self._shown:
+                await self._show(head)
+            self._message = None
+            self._shown = ""
+        if self._text and self._text != self._shown and time.monotonic() - self._last_edit >= EDIT_INTERVAL:
+            await self._show(self._text)
+
+    async def finish(self):
+        if not self._sent_any and not self._text.strip():
+            self._text = EMPTY_REPLY
+        if self._text and self._text != self._shown:
+            await self._show(self._text)
+        return self.full_text
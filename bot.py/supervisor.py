@@ -0,0 +1,141 @@
+import os
+import sys
+import time
+import signal
+import asyncio
+import aiohttp  # type: ignore[reportMissingImports]
+from dotenv import load_dotenv  # type: ignore[reportMissingImports]
+# Load .env before shards reads its settings from the environment
+load_dotenv()
+from shards import format_shard_ids
+
+# Runs the bot as SHARD_WORKERS processes that each own a contiguous range
+# of the SHARD_COUNT shards, and restarts any that exit. Workers share the
+# SQLite store (BOT_DB_PATH) for settings and upstream cooldowns.
+#
+#   python supervisor.py
+
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+# Discord allows one IDENTIFY per 5 seconds per rate limit bucket; worker
+# start-ups are staggered so their shards don't identify at the same time
+IDENTIFY_INTERVAL = float(os.getenv("SHARD_IDENTIFY_INTERVAL", "5"))
+RESTART_DELAY = float(os.getenv("SHARD_RESTART_DELAY", "5"))
+MAX_RESTART_DELAY = float(os.getenv("SHARD_MAX_RESTART_DELAY", "300"))
+# A worker that stayed up this long counts as healthy and restarts without delay growth
+STABLE_AFTER = float(os.getenv("SHARD_STABLE_AFTER", "60"))
+
+
+async def recommended_shard_count(token):
+    # Same endpoint discord.py uses for AutoShardedClient without a shard count
+    headers = {"Authorization": f"Bot {token}"}
+    async with aiohttp.ClientSession() as session:
+        async with session.get("https://discord.com/api/v10/gateway/bot", headers=headers) as resp:
+            resp.raise_for_status()
+            return (await resp.json())["shards"]
+
+
+def split_shards(shard_count, workers):
+    # Contiguous ranges, sizes differing by at most one
+    workers = max(1, min(workers, shard_count))
+    size, extra = divmod(shard_count, workers)
+    ranges, start = [], 0
+    for i in range(workers):
+        end = start + size + (1 if i < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+class Worker:
+    def __init__(self, index, shard_ids, shard_count, workers):
+        self.index = index
+        self.shard_ids = shard_ids
+        self.label = f"worker {index} (shards {format_shard_ids(shard_ids)})"
+        self.env = dict(
+            os.environ,
+            SHARD_MODE="worker",
+            SHARD_IDS=format_shard_ids(shard_ids),
+            SHARD_COUNT=str(shard_count),
+            SHARD_WORKERS=str(workers),
+        )
+        metrics_port = int(os.getenv("METRICS_PORT", "0"))
+        if metrics_port:
+            # One /metrics endpoint per worker on consecutive ports
+            self.env["METRICS_PORT"] = str(metrics_port + index)
+        self.proc = None
+
+    async def run(self, stopping, start_delay):
+        delay = RESTART_DELAY
+        await _sleep_unless(stopping, start_delay)
+        while not stopping.is_set():
+            started = time.monotonic()
+            print(f"Starting {self.label}")
+            self.proc = await asyncio.create_subprocess_exec(sys.executable, BOT_SCRIPT, env=self.env)
+            code = await self.proc.wait()
+            if stopping.is_set():
+                return
+            if time.monotonic() - started >= STABLE_AFTER:
+                delay = RESTART_DELAY
+            print(f"{self.label} exited with code {code}; restarting in {delay:.0f}s")
+            await _sleep_unless(stopping, delay)
+            delay = min(delay * 2, MAX_RESTART_DELAY)
+
+    async def stop(self, timeout=30):
+        if self.proc is None or self.proc.returncode is not None:
+            return
+        self.proc.terminate()
+        try:
+            await asyncio.wait_for(self.proc.wait(), timeout)
+        except asyncio.TimeoutError:
+            print(f"{self.label} did not stop in {timeout}s; killing it")
+            self.proc.kill()
+            await self.proc.wait()
+
+
+async def _sleep_unless(stopping, seconds):
+    try:
+        await asyncio.wait_for(stopping.wait(), seconds)
+    except asyncio.TimeoutError:
+        pass
+
+
+async def main():
+    shard_count = int(os.getenv("SHARD_COUNT", "0"))
+    if not shard_count:
+        shard_count = await recommended_shard_count(os.getenv("TOKEN"))
+        print(f"Discord recommends {shard_count} shards")
+    workers = int(os.getenv("SHARD_WORKERS", str(os.cpu_count() or 1)))
+    ranges = split_shards(shard_count, workers)
+    pool = [Worker(i, ids, shard_count, len(ranges)) for i, ids in enumerate(ranges)]
+    print(f"Running {shard_count} shards across {len(pool)} workers")
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stopping.set)
+        except (NotImplementedError, AttributeError):
+            pass  # Windows: Ctrl+C arrives as KeyboardInterrupt instead
+
+    runners = []
+    start_delay = 0.0
+    for worker in pool:
+        runners.append(asyncio.ensure_future(worker.run(stopping, start_delay)))
+        start_delay += IDENTIFY_INTERVAL * len(worker.shard_ids)
+    try:
+        await stopping.wait()
+    finally:
+        print("Stopping workers")
+        stopping.set()
+        await asyncio.gather(*(worker.stop() for worker in pool))
+        await asyncio.gather(*runners, return_exceptions=True)
+
+
+if __name__ == "__main__":
+    # Fix Windows asyncio shutdown noise ("Event loop is closed")
+    if os.name == 'nt':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,144 @@
+import os
+import time
+import asyncio
+from collections import deque
+import discord  # type: ignore[reportMissingImports]
+import metrics
+
+# Welcome messages that hold up during raids and big invite waves.
+# Normally every member gets their own embed. Once a guild sees more than
+# WELCOME_BURST_THRESHOLD joins within WELCOME_RATE_WINDOW seconds, further
+# joins are queued and welcomed together, one message per batch window.
+# The queue is bounded and entries older than WELCOME_MAX_AGE are dropped,
+# since a welcome that arrives minutes late is just noise.
+
+BURST_THRESHOLD = int(os.getenv("WELCOME_BURST_THRESHOLD", "5"))
+RATE_WINDOW = float(os.getenv("WELCOME_RATE_WINDOW", "10"))
+BATCH_WINDOW = float(os.getenv("WELCOME_BATCH_WINDOW", "5"))
+BATCH_SIZE = int(os.getenv("WELCOME_BATCH_SIZE", "25"))
+BACKLOG = int(os.getenv("WELCOME_BACKLOG", "200"))
+MAX_AGE = float(os.getenv("WELCOME_MAX_AGE", "120"))
+
+WELCOME_IMAGE = "https://cdn.discordapp.com/attachments/998612463492812822/1063409897871511602/welcome.png"
+WELCOME_COLOR = 0xfc30ff
+
+
+def build_template():
+    # The parts every welcome shares; copied per message instead of rebuilt
+    embed = discord.Embed(title="Welcome!", color=WELCOME_COLOR)
+    embed.set_image(url=WELCOME_IMAGE)
+    return embed
+
+
+class _GuildWelcomes:
+    __slots__ = ("window_start", "window_joins", "pending", "dropped", "task")
+
+    def __init__(self):
+        self.window_start = 0.0
+        self.window_joins = 0
+        self.pending = deque()  # (queued at, mention)
+        self.dropped = 0  # since the last batch message
+        self.task = None
+
+
+class WelcomeDispatcher:
+    def __init__(self, get_channel, threshold=BURST_THRESHOLD, rate_window=RATE_WINDOW, batch_window=BATCH_WINDOW,
+                 batch_size=BATCH_SIZE, backlog=BACKLOG, max_age=MAX_AGE):
+        # get_channel(guild_id) -> welcome channel or None
+        self.get_channel = get_channel
+        self.threshold = threshold
+        self.rate_window = rate_window
+        self.batch_window = batch_window
+        self.batch_size = max(1, batch_size)
+        self.backlog = max(1, backlog)
+        self.max_age = max_age
+        self._template = build_template()
+        self._guilds = {}  # guild id -> _GuildWelcomes
+        self.sent_single = 0
+        self.sent_batches = 0
+        self.batched_members = 0
+        self.dropped = 0
+
+    def _bursting(self, state, now):
+        return now - state.window_start < self.rate_window and state.window_joins > self.threshold
+
+    async def member_joined(self, member):
+        guild = member.guild
+        if self.get_channel(guild.id) is None:
+            return
+        state = self._guilds.get(guild.id)
+        if state is None:
+            state = self._guilds[guild.id] = _GuildWelcomes()
+        now = time.monotonic()
+        if now - state.window_start >= self.rate_window:
+            state.window_start = now
+            state.window_joins = 0
+        state.window_joins += 1
+        if state.task is None and not self._bursting(state, now):
+            await self._send_single(member)
+            return
+        # Burst: queue for the next batch, dropping the oldest when full
+        if len(state.pending) >= self.backlog:
+            state.pending.popleft()
+            state.dropped += 1
+            self.dropped += 1
+        state.pending.append((now, member.mention))
+        if state.task is None:
+            state.task = asyncio.ensure_future(self._drain(guild.id, guild.name, state))
+
+    async def _drain(self, guild_id, guild_name, state):
+        try:
+            while True:
+                await asyncio.sleep(self.batch_window)
+                now = time.monotonic()
+                while state.pending and now - state.pending[0][0] > self.max_age:
+                    state.pending.popleft()
+                    state.dropped += 1
+                    self.dropped += 1
+                if state.pending:
+                    batch = [state.pending.popleft()[1] for _ in range(min(self.batch_size, len(state.pending)))]
+                    await self._send_batch(guild_id, guild_name, batch, state.dropped)
+                    state.dropped = 0
+                elif not self._bursting(state, now):
+                    # Queue drained and the wave is over; back to one embed per member
+                    return
+        finally:
+            state.task = None
+            if not state.pending:
+                self._guilds.pop(guild_id, None)
+
+    async def _send(self, guild_id, embed):
+        channel = self.get_channel(guild_id)
+        if channel is None:
+            return False
+        try:
+            with metrics.discord_send_seconds.time("welcome"):
+                await channel.send(embed=embed)
+        except discord.HTTPException as e:
+            print(f"Failed to send welcome message in guild {guild_id}: {e}")
+            return False
+        return True
+
+    async def _send_single(self, member):
+        embed = self._template.copy()
+        embed.description = f"Ara ara! {member.mention}, welcome to **{member.guild.name}**! Hope you find Peace here."
+        embed.set_thumbnail(url=member.avatar)
+        embed.set_footer(text=f"{member.name} joined!")
+        if await self._send(member.guild.id, embed):
+            self.sent_single += 1
+
+    async def _send_batch(self, guild_id, guild_name, mentions, missed):
+        embed = self._template.copy()
+        others = f" (and {missed} more)" if missed else ""
+        embed.description = f"Ara ara! {', '.join(mentions)}{others}, welcome to **{guild_name}**! Hope you all find Peace here."
+        embed.set_footer(text=f"{len(mentions) + missed} members joined!")
+        if await self._send(guild_id, embed):
+            self.sent_batches += 1
+            self.batched_members += len(mentions)
+
+    async def close(self):
+        tasks = [state.task for state in self._guilds.values() if state.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._guilds.clear()